@@ -1,8 +1,85 @@
 # chunking_analysis.py
 import os
 import json
+import multiprocessing
+from functools import lru_cache, partial
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+try:
+    import orjson
+except ImportError:  # optional speed-up, fall back to stdlib json
+    orjson = None
+
+@lru_cache(maxsize=None)
+def _get_splitter(chunk_size, chunk_overlap):
+    """Return this process's text splitter for the given sizes, built lazily on first use."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+
+def _load_patent_json(file_path):
+    """Parse a patent JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _iter_patent_files(folder_path):
+    """Yield JSON file paths lazily; DirEntry caches the type info from the scan."""
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json"):
+                yield entry.path
+
+def _process_one(file_entry, chunk_size, chunk_overlap):
+    """
+    Pool worker: parse one patent file and split it into chunks.
+    Returns a plain dict so the parent process can aggregate the results.
+    """
+    file_idx, file_path = file_entry
+    file_name = os.path.basename(file_path)
+
+    try:
+        patent = _load_patent_json(file_path)
+
+        # Extract data (same logic as your data_loader.py)
+        patent_number = patent.get("patent_number", f"patent_{file_idx}")
+
+        # Extract English fields
+        abstract = extract_english_field(patent.get("abstracts", []), "paragraph_markup")
+
+        claims_data = patent.get("claims", [{}])[0].get("claims", [])
+        claims_text = " ".join(
+            c.get("paragraph_markup", "") for c in claims_data if c.get("lang") == "EN"
+        )
+
+        # Stripped like data_loader, so whitespace-only fields count as no content
+        combined_text = " ".join(filter(None, (abstract, claims_text))).strip()
+
+        if not combined_text:
+            return {'file': file_name, 'patent': patent_number, 'chunks': None}
+
+        # Split into chunks (same as your logic). Text that already fits in one
+        # chunk always yields exactly one, so skip the splitter
+        if len(combined_text) <= chunk_size:
+            chunks = [combined_text]
+        else:
+            chunks = _get_splitter(chunk_size, chunk_overlap).split_text(combined_text)
+
+        return {
+            'file': file_name,
+            'patent': patent_number,
+            'chunks': len(chunks),
+            'content_length': len(combined_text),
+            'abstract_length': len(abstract) if abstract else 0,
+            'claims_length': len(claims_text) if claims_text else 0
+        }
+
+    except Exception as e:
+        return {'file': file_name, 'error': str(e)}
+
 def analyze_chunking_process(folder_path="patent_jsons", chunk_size=2500, chunk_overlap=150):
     """
     Detailed analysis of why 500 files produced only 487 chunks
@@ -11,14 +88,6 @@ def analyze_chunking_process(folder_path="patent_jsons", chunk_size=2500, chunk_
     print("🔍 CHUNKING ANALYSIS - Why 500 files = 487 chunks?")
     print("=" * 80)
     
-    # Initialize text splitter (same as in your data_loader.py)
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, 
-        chunk_overlap=chunk_overlap
-    )
-    
-    json_files = [f for f in os.listdir(folder_path) if f.endswith(".json")]
-    
     total_files = 0
     total_chunks = 0
     files_with_no_chunks = []
@@ -26,39 +95,26 @@ def analyze_chunking_process(folder_path="patent_jsons", chunk_size=2500, chunk_
     chunk_distribution = {}
     content_length_analysis = []
     
-    for file_idx, file_name in enumerate(json_files):
-        file_path = os.path.join(folder_path, file_name)
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                patent = json.load(f)
+    # Parse + split files in parallel; aggregation stays in this process
+    worker = partial(_process_one, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    json_files = enumerate(_iter_patent_files(folder_path))
+    with multiprocessing.Pool(os.cpu_count()) as pool:
+        for result in pool.imap_unordered(worker, json_files, chunksize=16):
+            if 'error' in result:
+                print(f"❌ Error processing {result['file']}: {result['error']}")
+                continue
             
             total_files += 1
             
-            # Extract data (same logic as your data_loader.py)
-            patent_number = patent.get("patent_number", f"patent_{file_idx}")
-            
-            # Extract English fields
-            abstract = extract_english_field(patent.get("abstracts", []), "paragraph_markup")
-            
-            claims_data = patent.get("claims", [{}])[0].get("claims", [])
-            claims_text = " ".join(
-                [c.get("paragraph_markup", "") for c in claims_data if c.get("lang") == "EN"]
-            )
-            
-            combined_text = f"{abstract} {claims_text}".strip()
-            
-            if not combined_text:
+            if result['chunks'] is None:
                 files_with_no_chunks.append({
-                    'file': file_name,
-                    'patent': patent_number,
+                    'file': result['file'],
+                    'patent': result['patent'],
                     'reason': 'Empty content after combining abstract + claims'
                 })
                 continue
             
-            # Split into chunks (same as your logic)
-            chunks = splitter.split_text(combined_text)
-            chunk_count = len(chunks)
+            chunk_count = result['chunks']
             total_chunks += chunk_count
             
             # Track chunk distribution
@@ -69,26 +125,22 @@ def analyze_chunking_process(folder_path="patent_jsons", chunk_size=2500, chunk_
             
             # Store content analysis
             content_length_analysis.append({
-                'file': file_name,
-                'patent': patent_number,
-                'content_length': len(combined_text),
+                'file': result['file'],
+                'patent': result['patent'],
+                'content_length': result['content_length'],
                 'chunks_created': chunk_count,
-                'abstract_length': len(abstract) if abstract else 0,
-                'claims_length': len(claims_text) if claims_text else 0
+                'abstract_length': result['abstract_length'],
+                'claims_length': result['claims_length']
             })
             
             # Track files with multiple chunks
             if chunk_count > 1:
                 files_with_multiple_chunks.append({
-                    'file': file_name,
-                    'patent': patent_number,
+                    'file': result['file'],
+                    'patent': result['patent'],
                     'chunks': chunk_count,
-                    'content_length': len(combined_text)
+                    'content_length': result['content_length']
                 })
-                
-        except Exception as e:
-            print(f"❌ Error processing {file_name}: {e}")
-            continue
     
     # Analysis Results
     print(f"📊 CHUNKING RESULTS:")
@@ -180,10 +232,7 @@ def analyze_chunking_process(folder_path="patent_jsons", chunk_size=2500, chunk_
 
 def extract_english_field(entries, field_name):
     """Extract English version of a specific field."""
-    for entry in entries:
-        if entry.get("lang") == "EN":
-            return entry.get(field_name, "")
-    return ""
+    return next((entry.get(field_name, "") for entry in entries if entry.get("lang") == "EN"), "")
 
 def debug_specific_file(file_name, folder_path="patent_jsons"):
     """Debug a specific file's chunking process"""
@@ -194,8 +243,7 @@ def debug_specific_file(file_name, folder_path="patent_jsons"):
     file_path = os.path.join(folder_path, file_name)
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            patent = json.load(f)
+        patent = _load_patent_json(file_path)
         
         patent_number = patent.get("patent_number", "UNKNOWN")
         
@@ -218,10 +266,10 @@ def debug_specific_file(file_name, folder_path="patent_jsons"):
         abstract = extract_english_field(patent.get("abstracts", []), "paragraph_markup")
         claims_data = patent.get("claims", [{}])[0].get("claims", [])
         claims_text = " ".join(
-            [c.get("paragraph_markup", "") for c in claims_data if c.get("lang") == "EN"]
+            c.get("paragraph_markup", "") for c in claims_data if c.get("lang") == "EN"
         )
         
-        combined_text = f"{abstract} {claims_text}".strip()
+        combined_text = " ".join(filter(None, (abstract, claims_text))).strip()
         
         print(f"\nProcessed Text:")
         print(f"  Abstract length: {len(abstract)}")
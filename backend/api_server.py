@@ -1,19 +1,30 @@
 import os
+import re
+import json
+import asyncio
+import hashlib
 import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+import numpy as np
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from pinecone import Pinecone
 from dotenv import load_dotenv
 from gemini_helper import (
-    generate_dense_embedding,
+    generate_dense_embeddings_batch,
     generate_summary,
+    stream_summary,
     classify_query_type,
     generate_generic_answer,
     gemini_model,
     generation_config
 )
-from pinecone_helper import generate_sparse_embedding
+from pinecone_helper import generate_sparse_embedding, sq8_query, DENSE_SQ8
 import requests
 
 load_dotenv()
@@ -25,6 +36,23 @@ SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "patent_data.db")
 DB_PATH = os.getenv("SQLITE_DB_PATH", "patent_data.db")
 DB_URL = os.getenv("SQLITE_DB_URL")
 
+# Max vector ids bound into a single IN (...) query
+SQLITE_IN_BATCH_SIZE = 500
+
+# Normalized queries whose dense embeddings are kept in memory
+DENSE_CACHE_SIZE = int(os.getenv("DENSE_CACHE_SIZE", "2048"))
+
+# Follow-up prefilter: only the closest previous questions are sent to Gemini.
+# The threshold stays low because only questions are compared, not answers.
+FOLLOWUP_SIMILARITY_THRESHOLD = float(os.getenv("FOLLOWUP_SIMILARITY_THRESHOLD", "0.2"))
+FOLLOWUP_MAX_CANDIDATES = int(os.getenv("FOLLOWUP_MAX_CANDIDATES", "3"))
+# Follow-up verdicts kept in memory, keyed by a digest of the texts involved
+FOLLOWUP_CACHE_SIZE = 4096
+
+# Queries mentioning any of these are always treated as specific
+TECHNICAL_TERMS = ["microprocessor", "pipeline", "semiconductor", "AI", "neural", "cache", "encryption", "robotics", "sensor", "optics"]
+TECH_TERMS_RE = re.compile("|".join(map(re.escape, TECHNICAL_TERMS)), re.IGNORECASE)
+
 app = FastAPI(title="IntelliPatent Q&A Engine API", version="1.4.3")
 
 pc = Pinecone(api_key=PINECONE_API_KEY)
@@ -42,29 +70,237 @@ class SearchRequest(BaseModel):
     top_k: int = 5
     hybrid: bool = False
     summary: bool = False
+    stream: bool = False  # NDJSON response with live_summary streamed as it is generated
+
+
+@lru_cache(maxsize=64)
+def _metadata_query(n: int) -> str:
+    """
+    SQL for an n-id metadata lookup. Returning the identical string for the same n
+    lets sqlite3's statement cache reuse the prepared statement across requests.
+    """
+    placeholders = ",".join("?" * n)
+    return f"""SELECT vector_id, patent_number, title, detailed_summary 
+                FROM patent_chunks 
+                WHERE vector_id IN ({placeholders})"""
 
 
 def fetch_metadata_from_sqlite(vector_ids: List[str]):
-    conn = sqlite3.connect(SQLITE_DB_PATH)
-    cursor = conn.cursor()
-    placeholders = ",".join("?" for _ in vector_ids)
-    cursor.execute(
-        f"""SELECT vector_id, patent_number, title, detailed_summary 
-            FROM patent_chunks 
-            WHERE vector_id IN ({placeholders})""",
-        vector_ids
+    rows = []
+    with db_lock:
+        # vector_id is the PRIMARY KEY, so each IN batch is a set of index lookups
+        for start in range(0, len(vector_ids), SQLITE_IN_BATCH_SIZE):
+            batch = vector_ids[start:start + SQLITE_IN_BATCH_SIZE]
+            cursor = db_conn.execute(_metadata_query(len(batch)), batch)
+            rows.extend(cursor.fetchall())
+    return [dict(row) for row in rows]
+
+
+def _normalize_query(text: str) -> str:
+    return text.strip().lower()
+
+
+# Normalized query -> float32 dense embedding, in LRU order
+_dense_cache = OrderedDict()
+_dense_cache_lock = threading.Lock()
+
+# Normalized query -> sparse embedding, in LRU order
+_sparse_cache = OrderedDict()
+_sparse_cache_lock = threading.Lock()
+SPARSE_CACHE_SIZE = 2048
+
+
+def _dense_cached_many(queries: List[str]) -> List[np.ndarray]:
+    """
+    Dense embeddings for queries, cached on the normalized text. Cache misses
+    embed the caller's stripped text together in one batched Gemini call;
+    failures raise so they are not cached.
+    """
+    keys = [_normalize_query(query) for query in queries]
+    found = {}
+    with _dense_cache_lock:
+        for key in keys:
+            if key in _dense_cache:
+                _dense_cache.move_to_end(key)
+                found[key] = _dense_cache[key]
+
+    missing = {}
+    for key, query in zip(keys, queries):
+        if key not in found and key not in missing:
+            missing[key] = query.strip()
+    if missing:
+        vectors = generate_dense_embeddings_batch(list(missing.values()))
+        if not vectors or len(vectors) != len(missing):
+            raise ValueError(f"Failed to generate dense embeddings for {len(missing)} query(ies)")
+        with _dense_cache_lock:
+            for key, values in zip(missing, vectors):
+                vector = np.asarray(values, dtype=np.float32)
+                _dense_cache[key] = found[key] = vector
+            while len(_dense_cache) > DENSE_CACHE_SIZE:
+                _dense_cache.popitem(last=False)
+
+    return [found[key] for key in keys]
+
+
+def _sparse_cached(query: str) -> dict:
+    """
+    Sparse embedding for a query, cached on the normalized text. A miss embeds
+    the caller's stripped text; failures raise so they are not cached.
+    """
+    key = _normalize_query(query)
+    with _sparse_cache_lock:
+        if key in _sparse_cache:
+            _sparse_cache.move_to_end(key)
+            return _sparse_cache[key]
+
+    sparse_emb = generate_sparse_embedding(query.strip(), use_disk_cache=False)
+    if not sparse_emb:
+        raise ValueError(f"Failed to generate sparse embedding for: {query[:50]}")
+    with _sparse_cache_lock:
+        _sparse_cache[key] = sparse_emb
+        while len(_sparse_cache) > SPARSE_CACHE_SIZE:
+            _sparse_cache.popitem(last=False)
+    return sparse_emb
+
+
+def cached_dense_embedding(text: str):
+    """Dense embedding of a query via the LRU cache (None on failure)."""
+    try:
+        return _dense_cached_many([text])[0].tolist()
+    except Exception as e:
+        print(f"⚠ Dense embedding unavailable: {e}")
+        return None
+
+
+def cached_sparse_embedding(text: str):
+    """Sparse embedding of a query via the LRU cache (None on failure)."""
+    try:
+        return _sparse_cached(text)
+    except Exception as e:
+        print(f"⚠ Sparse embedding unavailable: {e}")
+        return None
+
+
+def _followup_candidates(relevant_turns: List[ConversationTurn], new_question: str) -> List[int]:
+    """
+    Cheap prefilter before the Gemini relevance check.
+    Returns indices of the previous turns most similar to new_question (best first).
+    When none passes the threshold the most recent turn is still returned, since
+    short anaphoric follow-ups ("what are its claims?") embed far from anything.
+    Uncached questions are embedded in a single batched call.
+    """
+    try:
+        new_vec, *prev = _dense_cached_many([new_question] + [turn.question for turn in relevant_turns])
+        prev_vecs = np.stack(prev)
+    except Exception as e:
+        print(f"⚠ Follow-up prefilter unavailable, checking all turns: {e}")
+        return list(range(len(relevant_turns) - 1, -1, -1))
+
+    norms = np.linalg.norm(prev_vecs, axis=1) * np.linalg.norm(new_vec)
+    similarities = (prev_vecs @ new_vec) / np.where(norms == 0, 1.0, norms)
+    ranked = np.argsort(-similarities)[:FOLLOWUP_MAX_CANDIDATES]
+    candidates = [int(i) for i in ranked if similarities[i] >= FOLLOWUP_SIMILARITY_THRESHOLD]
+    return candidates or [len(relevant_turns) - 1]
+
+
+# blake2b digest of the texts -> Gemini verdict, in LRU order. Answers can run to
+# tens of KB, so only the digest is kept, never the text itself.
+_followup_cache = OrderedDict()
+_followup_cache_lock = threading.Lock()
+
+
+def _followup_key(kind: str, *texts: str) -> bytes:
+    """128-bit blake2b digest of kind and texts (length-prefixed so fields can't run together)."""
+    digest = hashlib.blake2b(kind.encode("utf-8"), digest_size=16)
+    for text in texts:
+        data = text.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.digest()
+
+
+def _followup_cached(key: bytes, compute):
+    """Return the cached verdict for key, or compute and store it; errors raise so they are not cached."""
+    with _followup_cache_lock:
+        if key in _followup_cache:
+            _followup_cache.move_to_end(key)
+            return _followup_cache[key]
+    value = compute()
+    with _followup_cache_lock:
+        _followup_cache[key] = value
+        while len(_followup_cache) > FOLLOWUP_CACHE_SIZE:
+            _followup_cache.popitem(last=False)
+    return value
+
+
+def _check_followup_pair(prev_question: str, prev_answer: str, new_question: str) -> bool:
+    """Whether new_question follows up on a single previous turn (cached)."""
+    return _followup_cached(
+        _followup_key("pair", prev_question, prev_answer, new_question),
+        lambda: _ask_followup_pair(prev_question, prev_answer, new_question)
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [
-        {
-            "vector_id": row[0],
-            "patent_number": row[1],
-            "title": row[2],
-            "detailed_summary": row[3]
-        }
-        for row in rows
-    ]
+
+
+def _ask_followup_pair(prev_question: str, prev_answer: str, new_question: str) -> bool:
+    """Ask Gemini whether new_question follows up on a single previous turn."""
+    prompt = f"""
+    Previous question: {prev_question}
+    Previous answer: {prev_answer}
+    New follow-up question: {new_question}
+
+    Is the new follow-up question relevant to the previous question and its answer?
+    Consider topics, themes, technical domains, and conceptual relationships.
+    Respond only with 'yes' or 'no'.
+    """
+    resp = gemini_model.generate_content(prompt, generation_config=generation_config)
+    if not resp or not hasattr(resp, "text"):
+        return False
+    text = resp.text.strip().lower()
+    return text.startswith("yes") or text.startswith("y")
+
+
+def _choose_candidate_pair(candidate_pairs: List[tuple], new_question: str) -> Optional[int]:
+    """
+    Ask Gemini once which (question, answer) pair, if any, new_question follows up on.
+    Returns the 0-based position in candidate_pairs, or None when none is related.
+    Raises ValueError if the reply cannot be parsed.
+    """
+    candidate_lines = "\n".join(
+        f"{n}) Q: {question}\n   A: {answer}"
+        for n, (question, answer) in enumerate(candidate_pairs, 1)
+    )
+    prompt = f"""
+    Candidates:
+    {candidate_lines}
+
+    New follow-up question: {new_question}
+
+    Is the new follow-up question relevant to any of the candidate questions and their answers?
+    Consider topics, themes, technical domains, and conceptual relationships.
+    Respond only with the number of the most related candidate, or 'none'.
+    """
+    resp = gemini_model.generate_content(prompt, generation_config=generation_config)
+    if not resp or not hasattr(resp, "text"):
+        raise ValueError("Empty response from Gemini")
+    text = resp.text.strip().lower()
+    if text.startswith("none"):
+        return None
+    match = re.match(r"\d+", text)
+    if not match or not 1 <= int(match.group()) <= len(candidate_pairs):
+        raise ValueError(f"Unexpected candidate reply: {text[:50]}")
+    return int(match.group()) - 1
+
+
+def _choose_related_turn(relevant_turns: List[ConversationTurn], candidates: List[int], new_question: str) -> Optional[int]:
+    """
+    Which candidate turn (if any) the new question follows up on, via the cached batched check.
+    Returns the index into relevant_turns, or None when no candidate is related.
+    Raises ValueError if the reply cannot be parsed.
+    """
+    candidate_pairs = [(relevant_turns[i].question, relevant_turns[i].answer or '') for i in candidates]
+    key = _followup_key("choose", new_question, *(text for pair in candidate_pairs for text in pair))
+    position = _followup_cached(key, lambda: _choose_candidate_pair(candidate_pairs, new_question))
+    return None if position is None else candidates[position]
 
 
 def check_followup_relevance_multi(relevant_turns: List[ConversationTurn], new_question: str) -> dict:
@@ -76,25 +312,26 @@ def check_followup_relevance_multi(relevant_turns: List[ConversationTurn], new_q
         'related_turn': ConversationTurn or None  # The actual related turn
     }
     """
-    for i, turn in enumerate(reversed(relevant_turns)):
-        prompt = f"""
-        Previous question: {turn.question}
-        Previous answer: {turn.answer or ''}
-        New follow-up question: {new_question}
-
-        Is the new follow-up question relevant to the previous question and its answer?
-        Consider topics, themes, technical domains, and conceptual relationships.
-        Respond only with 'yes' or 'no'.
-        """
+    candidates = _followup_candidates(relevant_turns, new_question)
+    if not candidates:
+        return {'is_related': False, 'related_to_index': None, 'related_turn': None}
+
+    # Single batched check over all candidates; per-turn checks are the fallback
+    try:
+        i = _choose_related_turn(relevant_turns, candidates, new_question)
+        if i is None:
+            return {'is_related': False, 'related_to_index': None, 'related_turn': None}
+        return {'is_related': True, 'related_to_index': i, 'related_turn': relevant_turns[i]}
+    except Exception as e:
+        print(f"⚠ Batched follow-up check failed, checking turns one by one: {e}")
+
+    for i in candidates:
+        turn = relevant_turns[i]
         try:
-            resp = gemini_model.generate_content(prompt, generation_config=generation_config)
-            if not resp or not hasattr(resp, "text"):
-                continue
-            text = resp.text.strip().lower()
-            if text.startswith("yes") or text.startswith("y"):
+            if _check_followup_pair(turn.question, turn.answer or '', new_question):
                 return {
                     'is_related': True,
-                    'related_to_index': len(relevant_turns) - 1 - i,  # Convert back to original index
+                    'related_to_index': i,
                     'related_turn': turn
                 }
         except Exception as e:
@@ -103,8 +340,76 @@ def check_followup_relevance_multi(relevant_turns: List[ConversationTurn], new_q
     
     return {'is_related': False, 'related_to_index': None, 'related_turn': None}
 
+async def _summary_fields(query: str, text: str, defer: bool) -> dict:
+    """live_summary for a regular response, or summary_input for _stream_search_result to stream."""
+    if defer:
+        return {"summary_input": (query, text)}
+    return {"live_summary": await asyncio.to_thread(generate_summary, query, text)}
+
+async def _retrieve(query: str, hybrid: bool, top_k: int, summary: bool, defer_summary: bool = False) -> Optional[dict]:
+    """
+    Embed the query, search Pinecone and load the matching metadata from SQLite.
+    Returns None when Pinecone has no matches, {"error": ...} if embedding fails,
+    otherwise {"results": [...]} (plus "live_summary" when summary is requested,
+    or "summary_input" when defer_summary leaves it to the stream).
+    """
+    # Dense + sparse embeddings are independent, so fetch them concurrently
+    if hybrid:
+        dense_emb, sparse_emb = await asyncio.gather(
+            asyncio.to_thread(cached_dense_embedding, query),
+            asyncio.to_thread(cached_sparse_embedding, query)
+        )
+    else:
+        dense_emb = await asyncio.to_thread(cached_dense_embedding, query)
+    if not dense_emb:
+        return {"error": "Failed to generate dense embedding."}
+    if DENSE_SQ8:
+        dense_emb = sq8_query(dense_emb)
+
+    if hybrid:
+        pinecone_results = await asyncio.to_thread(index.query, vector=dense_emb, sparse_vector=sparse_emb, top_k=top_k, include_metadata=False)
+    else:
+        pinecone_results = await asyncio.to_thread(index.query, vector=dense_emb, top_k=top_k, include_metadata=False)
+
+    vector_ids = [match["id"] for match in pinecone_results.get("matches", [])]
+    if not vector_ids:
+        return None
+
+    results = await asyncio.to_thread(fetch_metadata_from_sqlite, vector_ids)
+    if summary:
+        combined_text = " ".join([r["detailed_summary"] for r in results if r.get("detailed_summary")])
+        if not combined_text.strip():
+            return {"results": results, "live_summary": "No content available for summary."}
+        return {"results": results, **(await _summary_fields(query, combined_text, defer_summary))}
+
+    return {"results": results}
+
+
+def _stream_search_result(result: dict):
+    """
+    NDJSON stream: the response (minus the summary) on the first line, then
+    {"live_summary_delta": ...} lines as Gemini generates the summary.
+    """
+    summary_input = result.pop("summary_input", None)
+    if summary_input:
+        result["live_summary_stream"] = True
+    yield json.dumps(result) + "\n"
+    if summary_input:
+        for delta in stream_summary(*summary_input):
+            yield json.dumps({"live_summary_delta": delta}) + "\n"
+
+
 @app.post("/search")
 async def search_patents(request: SearchRequest):
+    result = await _search(request)
+    if not request.stream:
+        return result
+    return StreamingResponse(_stream_search_result(result), media_type="application/x-ndjson")
+
+
+async def _search(request: SearchRequest) -> dict:
+    # Every Gemini call (classification, follow-up check, answers, summaries) is
+    # blocking, so each runs in a worker thread to keep the event loop free.
     try:
         query_text = (request.query or "").strip()
         history = request.history or []
@@ -118,40 +423,23 @@ async def search_patents(request: SearchRequest):
         # ---- FIRST QUERY detection (no relevant context found) ----
         if not relevant_turns:
             print(f"🔍 First relevant query (no previous context): {query_text}")
-            query_type = classify_query_type(query_text)
-            technical_terms = ["microprocessor", "pipeline", "semiconductor", "AI", "neural", "cache", "encryption", "robotics", "sensor", "optics"]
-            force_specific = any(term.lower() in query_text.lower() for term in technical_terms)
+            query_type = await asyncio.to_thread(classify_query_type, query_text)
+            force_specific = bool(TECH_TERMS_RE.search(query_text))
 
             if query_type == "irrelevant" and not force_specific:
                 return {"results": [], "message": "Your query is not relevant to patents or intellectual property."}
 
             if query_type == "generic" and not force_specific:
-                answer = generate_generic_answer(query_text)
+                answer = await asyncio.to_thread(generate_generic_answer, query_text)
                 return {"results": [], "message": "Your query is patent-related but too general; here's a direct answer.", "generic_answer": answer}
 
             # Process as specific/relevant query
-            dense_emb = generate_dense_embedding(query_text)
-            if not dense_emb:
-                return {"error": "Failed to generate dense embedding."}
-
-            if request.hybrid:
-                sparse_emb = generate_sparse_embedding(query_text)
-                pinecone_results = index.query(vector=dense_emb, sparse_vector=sparse_emb, top_k=request.top_k, include_metadata=False)
-            else:
-                pinecone_results = index.query(vector=dense_emb, top_k=request.top_k, include_metadata=False)
-
-            vector_ids = [match["id"] for match in pinecone_results.get("matches", [])]
-            if not vector_ids:
-                fallback_answer = generate_generic_answer(query_text)
+            retrieved = await _retrieve(query_text, request.hybrid, request.top_k, request.summary, request.stream)
+            if retrieved is None:
+                fallback_answer = await asyncio.to_thread(generate_generic_answer, query_text)
                 return {"results": [], "message": "No relevant matches found; here's a direct Gemini answer.", "generic_answer": fallback_answer}
 
-            results = fetch_metadata_from_sqlite(vector_ids)
-            if request.summary:
-                combined_text = " ".join([r["detailed_summary"] for r in results if r.get("detailed_summary")])
-                live_summary = generate_summary(query_text, combined_text) if combined_text.strip() else "No content available for summary."
-                return {"results": results, "live_summary": live_summary}
-
-            return {"results": results}
+            return retrieved
 
         # ---- FOLLOW-UP QUERIES (relevant context exists) ----
         print(f"🔗 Follow-up query with {len(relevant_turns)} relevant context(s)")
@@ -165,18 +453,16 @@ async def search_patents(request: SearchRequest):
             print(f"📄 Summary request detected: '{query_text}'")
             # Use the most recent relevant context for summary
             last_relevant_turn = relevant_turns[-1]
-            summary_text = generate_summary(query_text, last_relevant_turn.answer or "")
             return {
                 "results": [], 
-                "live_summary": summary_text, 
+                **(await _summary_fields(query_text, last_relevant_turn.answer or "", request.stream)), 
                 "related": True,
                 "note": f"Summary of previous response (Query #{len(relevant_turns)})"
             }
         
         # ---- Check if current query is irrelevant ----
-        current_query_type = classify_query_type(query_text)
-        technical_terms = ["microprocessor", "pipeline", "semiconductor", "AI", "neural", "cache", "encryption", "robotics", "sensor", "optics"]
-        force_specific = any(term.lower() in query_text.lower() for term in technical_terms)
+        current_query_type = await asyncio.to_thread(classify_query_type, query_text)
+        force_specific = bool(TECH_TERMS_RE.search(query_text))
         
         if current_query_type == "irrelevant" and not force_specific:
             # Current query is irrelevant, but preserve previous relevant context
@@ -184,14 +470,14 @@ async def search_patents(request: SearchRequest):
 
         # ---- Smart Multi-Context Check ----
         # Check against ALL previous relevant queries to find the best match
-        relevance_result = check_followup_relevance_multi(relevant_turns, query_text)
+        relevance_result = await asyncio.to_thread(check_followup_relevance_multi, relevant_turns, query_text)
         
         if not relevance_result['is_related']:
             # Unrelated to ALL previous contexts, treat as NEW first query
             print(f"🆕 Unrelated to all previous contexts, treating as new query")
             
             if current_query_type == "generic" and not force_specific:
-                generic_answer = generate_generic_answer(query_text)
+                generic_answer = await asyncio.to_thread(generate_generic_answer, query_text)
                 return {
                     "results": [],
                     "message": "This is a new topic unrelated to previous queries.",
@@ -200,28 +486,14 @@ async def search_patents(request: SearchRequest):
                 }
 
             # Process as new specific query
-            dense_emb = generate_dense_embedding(query_text)
-            if not dense_emb:
-                return {"error": "Failed to generate dense embedding."}
-
-            if request.hybrid:
-                sparse_emb = generate_sparse_embedding(query_text)
-                pinecone_results = index.query(vector=dense_emb, sparse_vector=sparse_emb, top_k=request.top_k, include_metadata=False)
-            else:
-                pinecone_results = index.query(vector=dense_emb, top_k=request.top_k, include_metadata=False)
-
-            vector_ids = [match["id"] for match in pinecone_results.get("matches", [])]
-            if not vector_ids:
-                fallback_answer = generate_generic_answer(query_text)
+            retrieved = await _retrieve(query_text, request.hybrid, request.top_k, request.summary, request.stream)
+            if retrieved is None:
+                fallback_answer = await asyncio.to_thread(generate_generic_answer, query_text)
                 return {"results": [], "message": "No relevant matches found for this new topic.", "generic_answer": fallback_answer, "related": False}
+            if "error" in retrieved:
+                return retrieved
 
-            results = fetch_metadata_from_sqlite(vector_ids)
-            if request.summary:
-                combined_text = " ".join([r["detailed_summary"] for r in results if r.get("detailed_summary")])
-                live_summary = generate_summary(query_text, combined_text) if combined_text.strip() else "No content available for summary."
-                return {"results": results, "live_summary": live_summary, "related": False}
-
-            return {"results": results, "related": False}
+            return {**retrieved, "related": False}
 
         # ---- RELATED FOLLOW-UP (found matching context) ----
         related_turn = relevance_result['related_turn']
@@ -233,9 +505,9 @@ async def search_patents(request: SearchRequest):
         augmented_query = f"Previous Question: {related_turn.question}\nPrevious Answer: {related_turn.answer or ''}\nFollow-up Question: {query_text}"
         
         # Check if follow-up is generic
-        followup_query_type = classify_query_type(augmented_query)
+        followup_query_type = await asyncio.to_thread(classify_query_type, augmented_query)
         if followup_query_type == "generic":
-            generic_answer = generate_generic_answer(augmented_query)
+            generic_answer = await asyncio.to_thread(generate_generic_answer, augmented_query)
             return {
                 "results": [], 
                 "message": "This follow-up is relevant but generic.", 
@@ -245,19 +517,9 @@ async def search_patents(request: SearchRequest):
             }
 
         # Process specific follow-up with BEST matching context
-        dense_emb = generate_dense_embedding(augmented_query)
-        if not dense_emb:
-            return {"error": "Failed to generate dense embedding."}
-
-        if request.hybrid:
-            sparse_emb = generate_sparse_embedding(augmented_query)
-            pinecone_results = index.query(vector=dense_emb, sparse_vector=sparse_emb, top_k=request.top_k, include_metadata=False)
-        else:
-            pinecone_results = index.query(vector=dense_emb, top_k=request.top_k, include_metadata=False)
-
-        vector_ids = [match["id"] for match in pinecone_results.get("matches", [])]
-        if not vector_ids:
-            fallback_answer = generate_generic_answer(augmented_query)
+        retrieved = await _retrieve(augmented_query, request.hybrid, request.top_k, request.summary, request.stream)
+        if retrieved is None:
+            fallback_answer = await asyncio.to_thread(generate_generic_answer, augmented_query)
             return {
                 "results": [], 
                 "message": "No relevant matches found for this follow-up.", 
@@ -265,20 +527,11 @@ async def search_patents(request: SearchRequest):
                 "related": True,
                 "note": f"Based on context from query #{related_index + 1}"
             }
-
-        results = fetch_metadata_from_sqlite(vector_ids)
-        if request.summary:
-            combined_text = " ".join([r["detailed_summary"] for r in results if r.get("detailed_summary")])
-            live_summary = generate_summary(augmented_query, combined_text) if combined_text.strip() else "No content available for summary."
-            return {
-                "results": results, 
-                "live_summary": live_summary, 
-                "related": True,
-                "note": f"Results based on context from query #{related_index + 1}"
-            }
+        if "error" in retrieved:
+            return retrieved
 
         return {
-            "results": results, 
+            **retrieved,
             "related": True,
             "note": f"Results based on context from query #{related_index + 1}"
         }
@@ -289,22 +542,32 @@ async def search_patents(request: SearchRequest):
 
 # Add this endpoint to your api_server.py file, after your existing imports and before the /search endpoint
 
+def _probe_db():
+    with db_lock:
+        db_conn.execute("SELECT 1")
+
+
+def _probe_pinecone():
+    index.describe_index_stats()
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for API status monitoring"""
     try:
-        # Optional: Test database connection
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        conn.close()
-        
-        # Optional: Test Pinecone connection
-        index.describe_index_stats()
+        # Probe DB + Pinecone concurrently, off the event loop
+        probe_results = await asyncio.gather(
+            asyncio.to_thread(_probe_db),
+            asyncio.to_thread(_probe_pinecone),
+            return_exceptions=True
+        )
+        for probe_error in probe_results:
+            if isinstance(probe_error, Exception):
+                raise probe_error
         
         return {
             "status": "healthy",
-            "timestamp": os.popen('date').read().strip(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
             "version": "1.4.3",
             "services": {
                 "database": "connected",
@@ -315,7 +578,7 @@ async def health_check():
         return {
             "status": "degraded",
             "error": str(e),
-            "timestamp": os.popen('date').read().strip()
+            "timestamp": datetime.now(timezone.utc).isoformat()
         }
 
 @app.get("/")
@@ -334,15 +597,36 @@ def ensure_db_file():
         if not DB_URL:
             raise RuntimeError("Database not found locally and SQLITE_DB_URL not set")
         print(f"📥 Downloading DB from {DB_URL}...")
-        response = requests.get(DB_URL)
-        response.raise_for_status()
-        with open(DB_PATH, "wb") as f:
-            f.write(response.content)
+        # Stream to disk in 1 MB chunks so the DB is never held fully in memory
+        with requests.get(DB_URL, stream=True) as response:
+            response.raise_for_status()
+            with open(DB_PATH, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
         print("✅ Database downloaded and saved locally.")
     else:
         print("✔ Database already exists locally, skipping download.")
 
+
+def open_db_connection():
+    """Open the shared SQLite connection reused by every request."""
+    conn = sqlite3.connect(
+        SQLITE_DB_PATH,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=256
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-64000")
+    return conn
+
 # Call it before using DB
 ensure_db_file()
 
+# Opened once the DB file is in place; cursor access is guarded by db_lock
+db_conn = open_db_connection()
+db_lock = threading.Lock()
+
 
@@ -1,125 +1,404 @@
 # backend/data_loader.py
 import os
-import json
-import uuid
+import asyncio
+import logging
+import hashlib
+import mmap
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
 
 from pinecone_helper import (
     init_pinecone,
-    generate_sparse_embedding,
-    upsert_hybrid_vector
+    generate_sparse_embeddings,
+    upsert_hybrid_vectors_batch
 )
-from sqlite_helper import init_sqlite, insert_metadata, close_sqlite
-from gemini_helper import generate_dense_embedding, generate_summary
+from sqlite_helper import init_sqlite, insert_metadata_many, close_sqlite
+from gemini_helper import aembed_batch, generate_summary
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Patents prepared (summary generation + chunking) at once
+PREPARE_CONCURRENCY = int(os.getenv("PREPARE_CONCURRENCY", "8"))
+
+# Max patents whose embedding batches are in flight at once
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "5"))
+
+# Threads generating sparse embeddings, shared by all patents
+SPARSE_WORKERS = int(os.getenv("SPARSE_WORKERS", "8"))
+
+# Patents whose Pinecone upserts are in flight at once
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "2"))
+
+# Max patents buffered between pipeline stages
+PIPELINE_QUEUE_SIZE = 32
+
+# Max characters of patent text sent to Gemini for the stored summary
+SUMMARY_INPUT_CHARS = int(os.getenv("SUMMARY_INPUT_CHARS", "8000"))
+
+# Log an overall progress line every N stored chunks
+PROGRESS_EVERY = 100
+
+# Threads reading patent files, and how many files may be read ahead of processing
+LOAD_WORKERS = 8
+LOAD_PREFETCH = 32
+
+# Threads warming the page cache with MAP_POPULATE (Linux only)
+PAGE_CACHE_WORKERS = 16
+
 def load_patent_files(folder_path):
     """Return a list of JSON file paths from the given folder."""
-    return [
-        os.path.join(folder_path, f)
-        for f in os.listdir(folder_path)
-        if f.endswith(".json")
-    ]
+    with os.scandir(folder_path) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.is_file() and entry.name.endswith(".json")
+        ]
+
+def load_patent_json(file_path):
+    """Read and parse one patent file (runs on a loader thread). Returns None on failure."""
+    try:
+        with open(file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    except Exception as e:
+        logger.error("❌ Failed to load %s: %s", os.path.basename(file_path), e)
+        return None
+
+def _populate_page_cache(file_path):
+    """Map a file with MAP_POPULATE so the kernel reads it into the page cache."""
+    try:
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            mmap.mmap(
+                f.fileno(), 0, flags=mmap.MAP_SHARED | mmap.MAP_POPULATE, prot=mmap.PROT_READ
+            ).close()
+    except Exception as e:
+        # Best effort: the loader reads the file normally either way
+        logger.debug("Page-cache prefetch failed for %s: %s", os.path.basename(file_path), e)
+
+def prefetch_patent_files(file_paths):
+    """
+    Warm the page cache for all patent files in the background so that the
+    loader threads mostly hit memory. Returns immediately; skipped off Linux.
+    """
+    if not hasattr(mmap, "MAP_POPULATE"):
+        return
+    executor = ThreadPoolExecutor(max_workers=PAGE_CACHE_WORKERS)
+    for file_path in file_paths:
+        executor.submit(_populate_page_cache, file_path)
+    executor.shutdown(wait=False)
+
+def iter_loaded_patents(file_paths):
+    """
+    Yield (file_path, patent) in input order while a thread pool reads ahead.
+    At most LOAD_PREFETCH parsed files are held in memory at a time.
+    """
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            pending.append((file_path, executor.submit(load_patent_json, file_path)))
+            if len(pending) >= LOAD_PREFETCH:
+                ready_path, future = pending.popleft()
+                yield ready_path, future.result()
+        while pending:
+            ready_path, future = pending.popleft()
+            yield ready_path, future.result()
+
+# Splitter for the default chunking parameters, built once and reused
+_DEFAULT_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=2500, chunk_overlap=150)
 
 def split_text_into_chunks(text, chunk_size=2500, chunk_overlap=150):
     """Split text into overlapping chunks for embedding."""
+    if chunk_size == 2500 and chunk_overlap == 150:
+        return _DEFAULT_SPLITTER.split_text(text)
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     return splitter.split_text(text)
 
 def extract_english_field(entries, field_name):
     """Extract English version of a specific field."""
-    for entry in entries:
-        if entry.get("lang") == "EN":
-            return entry.get(field_name, "")
-    return ""
+    return next((entry.get(field_name, "") for entry in entries if entry.get("lang") == "EN"), "")
 
-def process_and_upsert_patents():
-    """Main function to process all patent files and upsert into Pinecone + SQLite."""
-    index = init_pinecone()
-    file_paths = load_patent_files("patent_jsons")
-    print(f"📊 Total Patent Files Found: {len(file_paths)}")
+def summary_excerpt(text, max_chars=None):
+    """
+    Trim text for the summary prompt: keep the head (abstract and first claims)
+    and the tail (last claims), dropping the middle once text exceeds max_chars.
+    """
+    max_chars = max_chars or SUMMARY_INPUT_CHARS
+    if len(text) <= max_chars:
+        return text
+    head_chars = max_chars * 3 // 4
+    tail_chars = max_chars - head_chars
+    return f"{text[:head_chars]} ... {text[-tail_chars:]}"
 
-    conn, cursor = init_sqlite()
-    total_chunks = 0
+def prepare_patent(file_idx, file_path, patent):
+    """Build a loaded patent's context (fields, summary, chunks)."""
+    if patent is None:
+        return None
+    logger.info("🟢 Processing File %d: %s", file_idx + 1, os.path.basename(file_path))
 
-    for file_idx, file_path in enumerate(file_paths):
-        file_name = os.path.basename(file_path)
+    # Extract fields
+    patent_number = patent.get("patent_number", f"patent_{file_idx}")
+    title = extract_english_field(patent.get("titles", []), "text")
+    abstract = extract_english_field(patent.get("abstracts", []), "paragraph_markup")
+    description = extract_english_field(patent.get("descriptions", []), "paragraph_markup")
 
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                patent = json.load(f)
-                print(f"\n🟢 Processing File {file_idx + 1}: {file_name}\n")
-        except Exception as e:
-            print(f"❌ Failed to load {file_name}: {e}")
-            continue
+    claims_data = patent.get("claims", [{}])[0].get("claims", [])
+    claims_text = " ".join(
+        c.get("paragraph_markup", "") for c in claims_data if c.get("lang") == "EN"
+    )
+
+    combined_text = f"{abstract} {claims_text}".strip()
+
+    if not combined_text:
+        logger.warning("⚠️ Skipping %s: No Abstract/Claims found.", patent_number)
+        return None
+
+    # Generate summary (from a bounded excerpt; chunks still use the full text)
+    detailed_summary = generate_summary(title or patent_number, summary_excerpt(combined_text))
 
-        # Extract fields
-        patent_number = patent.get("patent_number", f"patent_{file_idx}")
-        title = extract_english_field(patent.get("titles", []), "text")
-        abstract = extract_english_field(patent.get("abstracts", []), "paragraph_markup")
-        description = extract_english_field(patent.get("descriptions", []), "paragraph_markup")
+    # Split into chunks
+    chunks = split_text_into_chunks(combined_text)
+    logger.info("📄 %s: %d chunks created.", patent_number, len(chunks))
 
-        claims_data = patent.get("claims", [{}])[0].get("claims", [])
-        claims_text = " ".join(
-            [c.get("paragraph_markup", "") for c in claims_data if c.get("lang") == "EN"]
+    return {
+        "patent_number": patent_number,
+        "title": title,
+        "abstract": abstract,
+        "description": description,
+        "claims_text": claims_text,
+        "detailed_summary": detailed_summary,
+        "chunks": chunks,
+        "chunk_hashes": [chunk_hash(chunk) for chunk in chunks]
+    }
+
+def chunk_hash(chunk):
+    """Content hash used to deduplicate identical chunks before embedding."""
+    return hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).digest()
+
+async def embed_patent(patent_ctx, dense_by_hash):
+    """
+    Dense-embed one patent's chunks in a single batched Gemini call.
+    Only chunks not already in dense_by_hash (shared across patents) are sent.
+    """
+    chunk_hashes = patent_ctx["chunk_hashes"]
+    pending = {
+        h: chunk
+        for h, chunk in zip(chunk_hashes, patent_ctx["chunks"])
+        if h not in dense_by_hash
+    }
+    if pending:
+        dense_embeddings = await aembed_batch(list(pending.values()))
+        if dense_embeddings is None:
+            return None
+        # Kept as compact float16 arrays for the rest of the run instead of lists of Python floats
+        dense_by_hash.update(
+            (h, np.asarray(dense_embedding, dtype=np.float16))
+            for h, dense_embedding in zip(pending.keys(), dense_embeddings)
         )
+    return [dense_by_hash[h] for h in chunk_hashes]
 
-        combined_text = f"{abstract} {claims_text}".strip()
+async def sparse_embed_patent(executor, patent_ctx, sparse_by_hash):
+    """
+    Sparse-embed one patent's chunks in batched Pinecone calls on the shared thread
+    pool, concurrently with its dense batch. Failed chunks are left out of sparse_by_hash.
+    """
+    pending = {
+        h: chunk
+        for h, chunk in zip(patent_ctx["chunk_hashes"], patent_ctx["chunks"])
+        if h not in sparse_by_hash
+    }
+    if not pending:
+        return
+    loop = asyncio.get_running_loop()
+    sparse_embeddings = await loop.run_in_executor(
+        executor, generate_sparse_embeddings, list(pending.values())
+    )
+    sparse_by_hash.update(
+        (h, sparse_embedding)
+        for h, sparse_embedding in zip(pending.keys(), sparse_embeddings)
+        if sparse_embedding is not None
+    )
 
-        if not combined_text:
-            print(f"⚠️ Skipping {patent_number}: No Abstract/Claims found.")
-            continue
+def build_vectors(patent_ctx, dense_embeddings, sparse_by_hash):
+    """Pair a patent's dense and sparse embeddings and assign vector ids."""
+    patent_number = patent_ctx["patent_number"]
+    vectors_list = []
+    chunk_rows = zip(patent_ctx["chunk_hashes"], dense_embeddings)
+    for chunk_idx, (h, dense_embedding) in enumerate(chunk_rows):
+        # Deterministic id (chunk content hash) so re-runs overwrite instead of duplicating
+        vector_id = f"{patent_number}_chunk_{chunk_idx}_{h[:6].hex()}"
 
-        # Generate summary
-        detailed_summary = generate_summary(combined_text)
+        # Sparse embedding from Pinecone (missing if generation failed)
+        sparse_embedding = sparse_by_hash.get(h)
+        if sparse_embedding is None:
+            continue
 
-        # Split into chunks
-        chunks = split_text_into_chunks(combined_text)
-        print(f"📄 {patent_number}: {len(chunks)} chunks created.")
+        # Metadata (only key fields for search context)
+        metadata = {
+            "patent_number": patent_number,
+            "title": patent_ctx["title"]
+        }
+        # The index stores float32, so widen the float16 copy back for the upsert
+        dense_values = dense_embedding.astype(np.float32).tolist()
+        vectors_list.append((vector_id, dense_values, sparse_embedding, metadata))
+    return vectors_list
 
-        for chunk_idx, chunk in enumerate(chunks):
-            vector_id = f"{patent_number}_chunk_{chunk_idx}_{str(uuid.uuid4())[:8]}"
+# ---------------- Pipeline Stages ----------------
+# load -> prepare_queue -> summarize + chunk (PREPARE_CONCURRENCY workers)
+#   -> embed_queue -> dense + sparse embed (EMBED_CONCURRENCY workers)
+#   -> upsert_queue -> Pinecone upsert (UPSERT_CONCURRENCY workers)
+#                   -> sql_queue -> SQLite (concurrently with the upsert)
+# Queues are bounded so a fast stage can't run far ahead of a slow one.
+# None marks the end of a stream.
 
-            # Dense embedding from Gemini
-            dense_embedding = generate_dense_embedding(chunk)
-            if dense_embedding is None:
-                continue
+async def load_stage(file_paths, prepare_queue, consumers):
+    """Load patents off the event loop, feeding the prepare workers."""
+    loaded = enumerate(iter_loaded_patents(file_paths))
+    while True:
+        item = await asyncio.to_thread(next, loaded, None)
+        if item is None:
+            break
+        file_idx, (file_path, patent) = item
+        await prepare_queue.put((file_idx, file_path, patent))
+    for _ in range(consumers):
+        await prepare_queue.put(None)
 
-            # Sparse embedding from Pinecone
-            sparse_embedding = generate_sparse_embedding(chunk)
-            if sparse_embedding is None:
-                continue
+async def prepare_stage(prepare_queue, embed_queue):
+    """Summarize and chunk patents in a worker thread, feeding the embed workers."""
+    while (item := await prepare_queue.get()) is not None:
+        patent_ctx = await asyncio.to_thread(prepare_patent, *item)
+        if patent_ctx is not None:
+            await embed_queue.put(patent_ctx)
 
-            # Metadata (only key fields for search context)
-            metadata = {
-                "patent_number": patent_number,
-                "title": title
-            }
+async def embed_stage(embed_queue, upsert_queue, dense_by_hash, sparse_by_hash, sparse_executor):
+    """Dense- and sparse-embed patents from embed_queue and pass them on to the upserter."""
+    while (patent_ctx := await embed_queue.get()) is not None:
+        dense_embeddings, _ = await asyncio.gather(
+            embed_patent(patent_ctx, dense_by_hash),
+            sparse_embed_patent(sparse_executor, patent_ctx, sparse_by_hash)
+        )
+        if dense_embeddings is None:
+            logger.warning("⚠️ Skipping %s: Dense embedding failed.", patent_ctx["patent_number"])
+            continue
+        await upsert_queue.put((patent_ctx, dense_embeddings))
 
-            # Upsert into Pinecone
-            upsert_hybrid_vector(index, vector_id, dense_embedding, sparse_embedding, metadata)
+async def upsert_stage(index, upsert_queue, sql_queue, sparse_by_hash):
+    """
+    Hand each patent's rows to the SQLite writer and upsert it into Pinecone;
+    the disk-bound insert and the network-bound upsert run side by side.
+    """
+    while (item := await upsert_queue.get()) is not None:
+        patent_ctx, dense_embeddings = item
+        vectors_list = build_vectors(patent_ctx, dense_embeddings, sparse_by_hash)
 
-            # Store full metadata in SQLite
-            insert_metadata(
-                cursor,
+        metadata_rows = [
+            (
                 vector_id,
-                patent_number,
-                title,
-                description,
-                abstract,
-                claims_text,
-                detailed_summary
+                patent_ctx["patent_number"],
+                patent_ctx["title"],
+                patent_ctx["description"],
+                patent_ctx["abstract"],
+                patent_ctx["claims_text"],
+                patent_ctx["detailed_summary"]
             )
+            for vector_id, _, _, _ in vectors_list
+        ]
+        await sql_queue.put(metadata_rows)
 
-            print(f"🟢 Vector & Metadata Ready: {vector_id}")
-            total_chunks += 1
+        # Upsert the whole patent into Pinecone in parallel batches
+        upserted = await asyncio.to_thread(upsert_hybrid_vectors_batch, index, vectors_list)
+        if upserted < len(vectors_list):
+            logger.error(
+                "❌ %s: only %d/%d vectors reached Pinecone (metadata is still stored in SQLite)",
+                patent_ctx["patent_number"], upserted, len(vectors_list)
+            )
 
-    # Save & close SQLite connection
-    close_sqlite(conn)
-    print(f"📊 Total Chunks Processed: {total_chunks}")
+async def sql_stage(executor, cursor, sql_queue):
+    """
+    Store full metadata in SQLite: one executemany transaction per patent, run on
+    the single-thread executor that owns the connection. Returns the row count.
+    """
+    loop = asyncio.get_running_loop()
+    total_chunks = 0
+    while (metadata_rows := await sql_queue.get()) is not None:
+        await loop.run_in_executor(executor, insert_metadata_many, cursor, metadata_rows)
+        # Per-chunk lines are DEBUG only; INFO gets one line per patent
+        if logger.isEnabledFor(logging.DEBUG):
+            for row in metadata_rows:
+                logger.debug("🟢 Vector & Metadata Ready: %s", row[0])
+        if metadata_rows:
+            logger.info("🟢 %s: %d vectors & metadata stored", metadata_rows[0][1], len(metadata_rows))
+        previous_total = total_chunks
+        total_chunks += len(metadata_rows)
+        if total_chunks // PROGRESS_EVERY > previous_total // PROGRESS_EVERY:
+            logger.info("📊 Progress: %d chunks stored", total_chunks)
+    return total_chunks
+
+async def process_and_upsert_patents():
+    """Main function to process all patent files and upsert into Pinecone + SQLite."""
+    index = init_pinecone()
+    file_paths = load_patent_files("patent_jsons")
+    logger.info("📊 Total Patent Files Found: %d", len(file_paths))
+    prefetch_patent_files(file_paths)
+
+    # One dedicated thread opens, writes and closes the SQLite connection, so
+    # commits never block the event loop and the connection stays on its thread.
+    loop = asyncio.get_running_loop()
+    sql_executor = ThreadPoolExecutor(max_workers=1)
+    conn, cursor = await loop.run_in_executor(sql_executor, init_sqlite)
+
+    prepare_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    embed_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    upsert_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    sql_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    # Identical chunks (shared boilerplate) are embedded only once per run.
+    dense_by_hash = {}
+    sparse_by_hash = {}
+
+    async def run_preparers():
+        await asyncio.gather(*(
+            prepare_stage(prepare_queue, embed_queue)
+            for _ in range(PREPARE_CONCURRENCY)
+        ))
+        for _ in range(EMBED_CONCURRENCY):
+            await embed_queue.put(None)
 
+    async def run_embedders(sparse_executor):
+        await asyncio.gather(*(
+            embed_stage(embed_queue, upsert_queue, dense_by_hash, sparse_by_hash, sparse_executor)
+            for _ in range(EMBED_CONCURRENCY)
+        ))
+        for _ in range(UPSERT_CONCURRENCY):
+            await upsert_queue.put(None)
+
+    async def run_upserters():
+        await asyncio.gather(*(
+            upsert_stage(index, upsert_queue, sql_queue, sparse_by_hash)
+            for _ in range(UPSERT_CONCURRENCY)
+        ))
+        await sql_queue.put(None)
+
+    with ThreadPoolExecutor(max_workers=SPARSE_WORKERS) as sparse_executor:
+        *_, total_chunks = await asyncio.gather(
+            load_stage(file_paths, prepare_queue, PREPARE_CONCURRENCY),
+            run_preparers(),
+            run_embedders(sparse_executor),
+            run_upserters(),
+            sql_stage(sql_executor, cursor, sql_queue)
+        )
+
+    # Save & close SQLite connection
+    await loop.run_in_executor(sql_executor, close_sqlite, conn)
+    sql_executor.shutdown()
+    logger.info("📊 Total Chunks Processed: %d", total_chunks)
 
 if __name__ == "__main__":
-    process_and_upsert_patents()
+    logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[logging.StreamHandler()])
+    asyncio.run(process_and_upsert_patents())
@@ -1,7 +1,30 @@
 # backend/followup_helper.py
 import re
 from typing import Dict, List, Optional
-from .gemini_helper import gemini_model, generation_config
+from .gemini_helper import cached_generate
+
+# One pattern per field of the "is_followup / strength / type / confidence" reply,
+# so fields parse in any order; a missing field falls back to its default. A value
+# may follow other words on its line ("strength: very high").
+_FOLLOWUP_FIELD_RES = {
+    "is_followup": re.compile(r"is_followup\W*[^\n]*?\b(yes|no)\b", re.IGNORECASE),
+    "strength": re.compile(r"\bstrength\W*[^\n]*?\b(high|medium|low)\b", re.IGNORECASE),
+    "type": re.compile(r"\btype\W*(\w+)", re.IGNORECASE),
+    "confidence": re.compile(r"\bconfidence\W*?(\d*\.?\d+)", re.IGNORECASE),
+}
+_FOLLOWUP_TYPES = {"clarification", "expansion", "specific", "comparison", "application"}
+
+# Obvious off-topic subjects, matched as substrings in a single regex pass
+IRRELEVANT_TOPICS = [
+    "weather", "sports", "cooking", "movie", "music", "celebrity",
+    "politics", "religion", "travel", "shopping", "fashion",
+    "dating", "relationship", "game", "joke", "funny"
+]
+_IRRELEVANT_TOPICS_RE = re.compile("|".join(map(re.escape, IRRELEVANT_TOPICS)))
+
+# Separator and edge trimming for the comma-separated keyword reply
+_KEYWORD_SPLIT_RE = re.compile(r"\s*,\s*")
+_KEYWORD_EDGE_RE = re.compile(r"^[^a-z0-9]+|[^a-z0-9]+$")
 
 def analyze_followup_relationship(current_query: str, previous_query: str, previous_results: List[Dict]) -> Dict[str, any]:
     """
@@ -35,39 +58,33 @@ def analyze_followup_relationship(current_query: str, previous_query: str, previ
         confidence: [0.0 to 1.0]
         """
         
-        response = gemini_model.generate_content(prompt, generation_config=generation_config)
+        response_text = cached_generate(prompt)
         
-        if not response or not hasattr(response, "text"):
+        if response_text is None:
             return {"is_followup": False, "strength": "low", "type": "none", "confidence": 0.0}
         
         # Parse response
-        text = response.text.strip().lower()
+        fields = {}
+        for name, pattern in _FOLLOWUP_FIELD_RES.items():
+            match = pattern.search(response_text)
+            fields[name] = match.group(1) if match else None
+        is_followup, strength, followup_type, confidence = fields.values()
+        if not is_followup:
+            return {"is_followup": False, "strength": "low", "type": "none", "confidence": 0.0}
+        followup_type = (followup_type or "none").lower()
         result = {
-            "is_followup": "yes" in text.split("is_followup:")[1].split("\n")[0],
-            "strength": "high" if "high" in text else ("medium" if "medium" in text else "low"),
-            "type": "none",
+            "is_followup": is_followup.lower() == "yes",
+            "strength": (strength or "low").lower(),
+            "type": followup_type if followup_type in _FOLLOWUP_TYPES else "none",
             "confidence": 0.0
         }
         
-        # Extract type
-        if "clarification" in text:
-            result["type"] = "clarification"
-        elif "expansion" in text:
-            result["type"] = "expansion"
-        elif "specific" in text:
-            result["type"] = "specific"
-        elif "comparison" in text:
-            result["type"] = "comparison"
-        elif "application" in text:
-            result["type"] = "application"
-        
         # Extract confidence
-        try:
-            confidence_match = re.search(r"confidence:?\s*([0-9.]+)", text)
-            if confidence_match:
-                result["confidence"] = float(confidence_match.group(1))
-        except:
-            result["confidence"] = 0.5
+        if confidence:
+            try:
+                result["confidence"] = float(confidence)
+            except ValueError:
+                result["confidence"] = 0.5
         
         return result
     
@@ -151,10 +168,10 @@ def generate_contextual_response(query: str, previous_results: List[Dict], follo
             {combined_content}
             """
         
-        response = gemini_model.generate_content(prompt, generation_config=generation_config)
+        response_text = cached_generate(prompt)
         
-        if response and hasattr(response, "text"):
-            return response.text.strip()
+        if response_text is not None:
+            return response_text.strip()
         else:
             return "I couldn't generate a proper response based on the previous context."
     
@@ -180,11 +197,13 @@ def extract_keywords_from_results(results: List[Dict]) -> List[str]:
         Content: {combined_text[:2000]}
         """
         
-        response = gemini_model.generate_content(prompt, generation_config=generation_config)
+        response_text = cached_generate(prompt)
         
-        if response and hasattr(response, "text"):
-            keywords = [kw.strip().lower() for kw in response.text.strip().split(",")]
-            return [kw for kw in keywords if kw and len(kw) > 2][:15]
+        if response_text is not None:
+            keywords = (_KEYWORD_EDGE_RE.sub("", kw) for kw in _KEYWORD_SPLIT_RE.split(response_text.lower()))
+            keywords = (kw for kw in keywords if len(kw) > 2)
+            # dict.fromkeys dedups while keeping the reply's order
+            return list(dict.fromkeys(keywords))[:15]
         
         return []
     
@@ -192,31 +211,38 @@ def extract_keywords_from_results(results: List[Dict]) -> List[str]:
         print(f"❌ Keyword extraction error: {e}")
         return []
 
-def is_query_completely_irrelevant(query: str, context_keywords: List[str]) -> bool:
+def is_query_completely_irrelevant(query: str, context_keywords: List[str], infer: bool = True) -> bool:
     """
     Check if a follow-up query is completely irrelevant to the previous context.
+    Local keyword signals settle clear cases; Gemini is only asked when they are
+    ambiguous. Pass infer=False to skip the Gemini call entirely (e.g. when the
+    caller has already classified the query).
     """
     try:
         query_lower = query.lower()
         
-        # Check for obvious irrelevant topics
-        irrelevant_topics = [
-            "weather", "sports", "cooking", "movie", "music", "celebrity",
-            "politics", "religion", "travel", "shopping", "fashion",
-            "dating", "relationship", "game", "joke", "funny"
-        ]
-        
-        if any(topic in query_lower for topic in irrelevant_topics):
-            return True
+        # Check for obvious irrelevant topics (distinct topics mentioned)
+        irrelevant_hits = len(set(_IRRELEVANT_TOPICS_RE.findall(query_lower)))
         
         # Check overlap with context keywords
         query_words = set(query_lower.split())
-        context_words = set(context_keywords)
+        overlap = len(set(context_keywords) & query_words)
         
-        # If there's any overlap, it might be relevant
-        if context_words.intersection(query_words):
+        # Strong overlap with the previous context is conclusive
+        if overlap >= 2:
             return False
         
+        # Share of local signals pointing to "irrelevant" (0.5 = no signal either way)
+        signals = irrelevant_hits + overlap
+        irrelevance_score = irrelevant_hits / signals if signals else 0.5
+        if irrelevance_score >= 0.7:
+            return True
+        if irrelevance_score <= 0.3:
+            return False
+        
+        if not infer:
+            return irrelevance_score > 0.5
+        
         # Use Gemini for final determination
         prompt = f"""
         Is this query completely irrelevant to patents, intellectual property, or technology?
@@ -227,10 +253,10 @@ def is_query_completely_irrelevant(query: str, context_keywords: List[str]) -> b
         Answer with only 'yes' if completely irrelevant, or 'no' if it could be related.
         """
         
-        response = gemini_model.generate_content(prompt, generation_config=generation_config)
+        response_text = cached_generate(prompt)
         
-        if response and hasattr(response, "text"):
-            return "yes" in response.text.strip().lower()
+        if response_text is not None:
+            return "yes" in response_text.strip().lower()
         
         return False
     
@@ -1,9 +1,18 @@
 # backend/gemini_helper.py
 import os
+import re
+import threading
+from collections import OrderedDict
 import google.generativeai as genai_1
 from dotenv import load_dotenv
 from google.genai import types
 from google import genai
+# Relative when imported as backend.gemini_helper (e.g. via followup_helper),
+# flat when run from inside backend/ like api_server and data_loader
+try:
+    from .llm_cache import LLMCache
+except ImportError:
+    from llm_cache import LLMCache
 
 load_dotenv()
 
@@ -12,6 +21,9 @@ genai_1.configure(api_key=api_key)
 
 gemini_model = genai_1.GenerativeModel("gemini-2.5-flash-lite")
 
+# Shared embeddings client: reuses its HTTP connection pool across calls
+genai_client = genai.Client(api_key=api_key)
+
 generation_config = {
     "temperature": 0.4,
     "top_p": 1,
@@ -19,14 +31,16 @@ generation_config = {
     "max_output_tokens": 2500,
 }
 
+# Max texts sent in a single embed_content request
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+
 # ---------------------- Embeddings ----------------------
 def generate_dense_embedding(text):
     """Generate dense embeddings for a given text using Gemini."""
     try:
         if not text or not text.strip():
             return None
-        client = genai.Client(api_key=api_key)
-        result = client.models.embed_content(
+        result = genai_client.models.embed_content(
             model="gemini-embedding-001",
             contents=text,
             config=types.EmbedContentConfig(output_dimensionality=1536)
@@ -37,10 +51,70 @@ def generate_dense_embedding(text):
         return None
 
 
-# ---------------------- Summary ----------------------
-def generate_summary(query, result):
+def generate_dense_embeddings_batch(texts, batch_size=EMBED_BATCH_SIZE):
+    """Generate dense embeddings for a list of texts, one Gemini call per batch."""
     try:
-        prompt = f"""
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            result = genai_client.models.embed_content(
+                model="gemini-embedding-001",
+                contents=texts[start:start + batch_size],
+                config=types.EmbedContentConfig(output_dimensionality=1536)
+            )
+            vectors.extend(embedding.values for embedding in result.embeddings)
+        return vectors
+    except Exception as e:
+        print(f"❌ Dense Embedding Batch Error: {e}")
+        return None
+
+
+async def aembed_batch(texts, batch_size=EMBED_BATCH_SIZE):
+    """Async variant of generate_dense_embeddings_batch using Gemini's non-blocking client."""
+    try:
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            result = await genai_client.aio.models.embed_content(
+                model="gemini-embedding-001",
+                contents=texts[start:start + batch_size],
+                config=types.EmbedContentConfig(output_dimensionality=1536)
+            )
+            vectors.extend(embedding.values for embedding in result.embeddings)
+        return vectors
+    except Exception as e:
+        print(f"❌ Dense Embedding Batch Error: {e}")
+        return None
+
+
+# ---------------------- Response Cache ----------------------
+# Exact-prompt cache is always on; the semantic tier (prompt-embedding
+# similarity) is opt-in because prompts sharing a long template embed closely.
+llm_cache = LLMCache(
+    maxsize=int(os.environ.get("LLM_CACHE_SIZE", "1024")),
+    embed_fn=generate_dense_embedding if os.environ.get("LLM_SEMANTIC_CACHE") == "1" else None,
+    similarity_threshold=float(os.environ.get("LLM_SEMANTIC_THRESHOLD", "0.92")),
+    redis_url=os.environ.get("REDIS_URL")
+)
+
+
+def cached_generate(prompt, config=None):
+    """gemini_model.generate_content through llm_cache; returns the response text or None."""
+    config = config or generation_config
+    key = llm_cache.make_key(gemini_model.model_name, prompt, config)
+    text, vector = llm_cache.lookup(key, prompt)
+    if text is not None:
+        return text
+
+    response = gemini_model.generate_content(prompt, generation_config=config)
+    if not response or not hasattr(response, "text"):
+        return None
+    text = response.text
+    llm_cache.store(key, text, vector)
+    return text
+
+
+# ---------------------- Summary ----------------------
+def _summary_prompt(query, result):
+    return f"""
         You are an expert patent analyst. Based on the user's query '{query}', provide a comprehensive and structured summary of the following patent details.
 
         Your summary should be broken down into the following sections:
@@ -55,19 +129,76 @@ def generate_summary(query, result):
         Patent details from DB:
         {result}
         """
-        response = gemini_model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
-        return response.text.strip()
+
+
+def generate_summary(query, result):
+    try:
+        return cached_generate(_summary_prompt(query, result)).strip()
     except Exception as e:
         print(f"❌ Summary Generation Error: {e}")
         return ""
 
 
+def stream_summary(query, result):
+    """
+    Yield the summary text piece by piece as Gemini generates it.
+    A cached summary is yielded whole; a completed, non-empty stream is added to llm_cache.
+    """
+    prompt = _summary_prompt(query, result)
+    key = llm_cache.make_key(gemini_model.model_name, prompt, generation_config)
+    text, vector = llm_cache.lookup(key, prompt)
+    if text is not None:
+        yield text
+        return
+
+    try:
+        parts = []
+        for chunk in gemini_model.generate_content(prompt, generation_config=generation_config, stream=True):
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+        # An empty stream (blocked output) must not be replayed from the cache
+        if parts:
+            llm_cache.store(key, "".join(parts), vector)
+    except Exception as e:
+        print(f"❌ Summary Streaming Error: {e}")
+
+
 # ---------------------- Classification ----------------------
-def classify_query_type(query: str) -> str:
-    """Classify query as 'irrelevant', 'generic', or 'specific'."""
+# Queries naming a patent document or a CPC/IPC class are always 'specific';
+# those skip the Gemini round-trip. Vocabulary like "patent" or "claim" is not
+# enough ("what is a patent claim?" is generic), so only identifiers count.
+# Publication numbers (including the corpus form "US-6654854-B1") need a 6+
+# digit serial after the year or 7+ digits, so year ranges like "US 2019-2023"
+# or "US 2020/2021" do not match.
+SPECIFIC_QUERY_RE = re.compile(
+    r"\b(?:US|EP|WO|CN|JP|KR|DE|GB)[\s-]?(?:\d{4}[/-]\d{6,}|\d{7,})(?:[\s-]?[A-C]\d?)?\b"   # publication numbers
+    r"|\b[A-HY]\d{2}[A-Z]\s?\d{1,4}/\d{2,6}\b",                    # CPC / IPC groups
+    re.IGNORECASE
+)
+
+# Normalized query -> category, in LRU order. The key is case-folded but Gemini
+# sees the caller's text, since casing matters for acronyms and assignee names.
+CLASSIFY_CACHE_SIZE = 2048
+_classify_cache = OrderedDict()
+_classify_cache_lock = threading.Lock()
+
+def _classify_query_cached(query: str) -> str:
+    """Classification cached on the normalized query; errors raise so they are not cached."""
+    key = query.strip().lower()
+    with _classify_cache_lock:
+        if key in _classify_cache:
+            _classify_cache.move_to_end(key)
+            return _classify_cache[key]
+    category = _classify_query(query.strip())
+    with _classify_cache_lock:
+        _classify_cache[key] = category
+        while len(_classify_cache) > CLASSIFY_CACHE_SIZE:
+            _classify_cache.popitem(last=False)
+    return category
+
+def _classify_query(query: str) -> str:
+    """Gemini classification of a query; errors raise."""
     prompt = f"""
     You are a query classifier for a Patent Q&A system.
 
@@ -80,17 +211,21 @@ def classify_query_type(query: str) -> str:
 
     Query: {query}
     """
+    text = cached_generate(prompt)
+    if text is None:
+        raise ValueError("Empty classification response")
+    category = text.strip().lower()
+    if category not in ["irrelevant", "generic", "specific"]:
+        return "irrelevant"
+    return category
+
+
+def classify_query_type(query: str) -> str:
+    """Classify query as 'irrelevant', 'generic', or 'specific'."""
     try:
-        response = gemini_model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
-        if not response or not hasattr(response, "text"):
-            return "irrelevant"
-        category = response.text.strip().lower()
-        if category not in ["irrelevant", "generic", "specific"]:
-            return "irrelevant"
-        return category
+        if SPECIFIC_QUERY_RE.search(query):
+            return "specific"
+        return _classify_query_cached(query)
     except Exception as e:
         print(f"❌ Gemini classification error: {e}")
         return "irrelevant"
@@ -108,11 +243,7 @@ def generate_generic_answer(query: str) -> str:
 
         Provide structured and informative content without unnecessary details.
         """
-        response = gemini_model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
-        return response.text.strip()
+        return cached_generate(prompt).strip()
     except Exception as e:
         print(f"❌ Gemini generic answer error: {e}")
         return "Unable to generate a response."
@@ -0,0 +1,108 @@
+# backend/llm_cache.py
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import redis
+except ImportError:  # Redis is optional; the in-memory tier always works
+    redis = None
+
+
+class LLMCache:
+    """
+    Two-tier cache for LLM responses:
+    1. exact match on a SHA-256 of (model, prompt, generation config)
+    2. optional semantic match on the prompt embedding (cosine similarity)
+    """
+
+    def __init__(self, maxsize=1024, embed_fn=None, similarity_threshold=0.92, redis_url=None, ttl=86400):
+        self.maxsize = maxsize
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self._exact = OrderedDict()      # key -> response text (LRU order)
+        self._vectors = OrderedDict()    # key -> unit-norm prompt embedding
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url and redis is not None:
+            try:
+                self._redis = redis.Redis.from_url(redis_url)
+            except Exception as e:
+                print(f"⚠️ Redis cache unavailable, using memory only: {e}")
+
+    @staticmethod
+    def make_key(model_name, prompt, config):
+        payload = json.dumps([model_name, prompt, config], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, key, prompt):
+        """
+        Return (text, vector). text is None on a miss; vector is the prompt embedding
+        computed for the semantic lookup (pass it back to store() to avoid re-embedding).
+        """
+        with self._lock:
+            if key in self._exact:
+                self._exact.move_to_end(key)
+                return self._exact[key], None
+
+        if self._redis is not None:
+            try:
+                cached = self._redis.get(f"llm:{key}")
+                if cached is not None:
+                    text = cached.decode("utf-8")
+                    self._remember(key, text, None)
+                    return text, None
+            except Exception as e:
+                print(f"⚠️ Redis lookup error: {e}")
+
+        if self.embed_fn is None:
+            return None, None
+
+        vector = self._embed(prompt)
+        if vector is None:
+            return None, None
+
+        with self._lock:
+            if not self._vectors:
+                return None, vector
+            keys = list(self._vectors.keys())
+            similarities = np.stack(list(self._vectors.values())) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                best_key = keys[best]
+                self._exact.move_to_end(best_key)
+                return self._exact[best_key], vector
+        return None, vector
+
+    def store(self, key, text, vector=None):
+        self._remember(key, text, vector)
+        if self._redis is not None:
+            try:
+                self._redis.set(f"llm:{key}", text, ex=self.ttl)
+            except Exception as e:
+                print(f"⚠️ Redis store error: {e}")
+
+    def _remember(self, key, text, vector):
+        with self._lock:
+            self._exact[key] = text
+            self._exact.move_to_end(key)
+            if vector is not None:
+                self._vectors[key] = vector
+            while len(self._exact) > self.maxsize:
+                evicted, _ = self._exact.popitem(last=False)
+                self._vectors.pop(evicted, None)
+
+    def _embed(self, prompt):
+        try:
+            values = self.embed_fn(prompt)
+            if not values:
+                return None
+            vector = np.asarray(values, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            return vector / norm if norm else None
+        except Exception as e:
+            print(f"⚠️ Semantic cache embedding error: {e}")
+            return None
@@ -1,83 +1,226 @@
 # backend/pinecone_helper.py - FIXED VERSION
 import os
+import json
+import hashlib
+import sqlite3
+import threading
+import logging
+import numpy as np
 from pinecone import Pinecone
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY1")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
+UPSERT_POOL_THREADS = int(os.getenv("UPSERT_POOL_THREADS", "30"))
+
+# Pinecone rejects upsert requests over 2 MB; stay a little under it
+UPSERT_MAX_BYTES = 1_800_000
+# Rough JSON size of one serialized float / sparse index
+FLOAT_JSON_BYTES = 20
+INDEX_JSON_BYTES = 12
+
+# Opt-in SQ8 dense vectors: values are sent as int8 levels of one global scale,
+# so JSON payloads are ~4x smaller. The scale must be global (not per vector) to
+# keep dotproduct rankings intact, and queries are rescaled to match (sq8_query).
+# Enable it for a whole index at once; don't mix quantized and float vectors.
+DENSE_SQ8 = os.getenv("DENSE_SQ8") == "1"
+DENSE_SQ8_SCALE = float(os.getenv("DENSE_SQ8_SCALE", "0.25"))  # |values| clipped to this
 
 # Initialize Pinecone client
 pc_client = Pinecone(api_key=PINECONE_API_KEY)
 
-def init_pinecone():
+def init_pinecone(pool_threads=UPSERT_POOL_THREADS):
     """Initialize Pinecone index connection."""
     try:
-        index = pc_client.Index(PINECONE_INDEX_NAME)
-        print(f"✅ Connected to Pinecone index: {PINECONE_INDEX_NAME}")
+        # pool_threads lets async_req upserts run in parallel
+        index = pc_client.Index(PINECONE_INDEX_NAME, pool_threads=pool_threads)
+        logger.info("✅ Connected to Pinecone index: %s", PINECONE_INDEX_NAME)
         return index
     except Exception as e:
-        print(f"❌ Error initializing Pinecone: {e}")
+        logger.error("❌ Error initializing Pinecone: %s", e)
         return None
 
-def generate_sparse_embedding(text, for_query=False):
-    """Generate sparse embedding using Pinecone's sparse model."""
+SPARSE_MODEL = "pinecone-sparse-english-v0"
+# Max inputs per pinecone-sparse-english-v0 embed request
+SPARSE_BATCH_SIZE = 96
+
+# ---------------- Sparse Embedding Cache ----------------
+# Local SQLite store of {indices, values} keyed by sha256(model, input_type, text),
+# so re-ingesting unchanged text skips the inference round-trip. Only ingestion uses
+# it; query embeddings are cached in memory by the API. Lives next to patent_data.db
+# (SQLITE_DB_PATH, relative to the working directory). Empty path disables it.
+SPARSE_CACHE_PATH = os.getenv(
+    "SPARSE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(os.getenv("SQLITE_DB_PATH", "patent_data.db"))), "sparse_cache.db")
+)
+SPARSE_CACHE_IN_BATCH = 500
+
+_sparse_cache_conn = None
+_sparse_cache_lock = threading.Lock()
+
+def _sparse_cache():
+    """Open the cache DB on first use (shared across threads, guarded by _sparse_cache_lock)."""
+    global _sparse_cache_conn
+    if _sparse_cache_conn is None and SPARSE_CACHE_PATH:
+        try:
+            conn = sqlite3.connect(SPARSE_CACHE_PATH, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS emb (k TEXT PRIMARY KEY, v BLOB)")
+            conn.commit()
+            _sparse_cache_conn = conn
+        except Exception as e:
+            logger.warning("⚠️ Sparse cache unavailable: %s", e)
+    return _sparse_cache_conn
+
+def _sparse_cache_key(text, input_type):
+    return hashlib.sha256(f"{SPARSE_MODEL}\0{input_type}\0{text}".encode("utf-8")).hexdigest()
+
+def _sparse_cache_get_many(keys):
+    """Return {key: sparse_dict} for the keys already cached."""
+    found = {}
+    with _sparse_cache_lock:
+        conn = _sparse_cache()
+        if conn is None:
+            return found
+        try:
+            for start in range(0, len(keys), SPARSE_CACHE_IN_BATCH):
+                batch = keys[start:start + SPARSE_CACHE_IN_BATCH]
+                rows = conn.execute(
+                    f"SELECT k, v FROM emb WHERE k IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((k, json.loads(v)) for k, v in rows)
+        except Exception as e:
+            logger.warning("⚠️ Sparse cache lookup error: %s", e)
+    return found
+
+def _sparse_cache_put_many(items):
+    """Store (key, sparse_dict) pairs."""
+    with _sparse_cache_lock:
+        conn = _sparse_cache()
+        if conn is None:
+            return
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO emb (k, v) VALUES (?, ?)",
+                    ((k, json.dumps(v)) for k, v in items)
+                )
+        except Exception as e:
+            logger.warning("⚠️ Sparse cache store error: %s", e)
+
+
+def _sparse_from_attrs(embedding_data):
+    return embedding_data.sparse_indices, embedding_data.sparse_values
+
+def _sparse_from_dict(embedding_data):
+    return embedding_data.get('sparse_indices'), embedding_data.get('sparse_values')
+
+def _sparse_from_short_attrs(embedding_data):
+    return embedding_data.indices, embedding_data.values
+
+def _detect_sparse_accessor(embedding_data):
+    """Pick the accessor matching the SDK's result shape, or None if unrecognized."""
+    # Method 1: Direct attribute access
+    if hasattr(embedding_data, 'sparse_indices') and hasattr(embedding_data, 'sparse_values'):
+        return _sparse_from_attrs
+    # Method 2: Dictionary-like access
+    if isinstance(embedding_data, dict):
+        return _sparse_from_dict
+    # Method 3: Check for different attribute names (based on your original output)
+    if hasattr(embedding_data, 'indices') and hasattr(embedding_data, 'values'):
+        return _sparse_from_short_attrs
+    return None
+
+# Bound on the first response; the SDK returns the same shape every time
+_sparse_accessor = None
+
+def _extract_sparse(embedding_data):
+    """
+    Pull indices/values out of one inference result as a dict in Pinecone's
+    sparse_values format (passed to upserts and queries unchanged), or None.
+    """
+    global _sparse_accessor
+    if _sparse_accessor is None:
+        _sparse_accessor = _detect_sparse_accessor(embedding_data)
     try:
-        if not text or not text.strip():
-            print("⚠️ Skipped sparse embedding: Empty text")
-            return None
+        sparse_indices, sparse_values = _sparse_accessor(embedding_data)
+    except (TypeError, AttributeError):
+        sparse_indices = sparse_values = None
 
-        input_type = "query" if for_query else "passage"
+    if sparse_indices is None or sparse_values is None:
+        logger.error("❌ Could not extract sparse data from %s", type(embedding_data).__name__)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Available attributes: %s", dir(embedding_data))
+        return None
 
-        response = pc_client.inference.embed(
-            model="pinecone-sparse-english-v0",
-            inputs=[text],
-            parameters={"input_type": input_type, "truncate": "END"}
-        )
+    # Convert to the format expected by Pinecone (coerced in C by numpy; lists stay JSON-serializable)
+    return {
+        "indices": np.asarray(sparse_indices, dtype=np.int64).tolist(),
+        "values": np.asarray(sparse_values, dtype=np.float64).tolist()
+    }
 
-        if not response or not hasattr(response, "data") or len(response.data) == 0:
-            print("❌ Sparse embedding failed: No data in response")
-            return None
+def generate_sparse_embeddings(texts, for_query=False, batch_size=SPARSE_BATCH_SIZE, use_disk_cache=True):
+    """
+    Generate sparse embeddings for many texts, one Pinecone inference call per batch.
+    With use_disk_cache, cached texts are served locally and only the uncached ones are sent.
+    Returns a list aligned with texts; entries are None for empty texts or failed batches.
+    """
+    results = [None] * len(texts)
+    input_type = "query" if for_query else "passage"
 
-        # Get the first embedding result
-        embedding_data = response.data[0]
-        
-        # Try different ways to access sparse data
-        sparse_indices = None
-        sparse_values = None
-        
-        # Method 1: Direct attribute access
-        if hasattr(embedding_data, 'sparse_indices') and hasattr(embedding_data, 'sparse_values'):
-            sparse_indices = embedding_data.sparse_indices
-            sparse_values = embedding_data.sparse_values
-        
-        # Method 2: Dictionary-like access
-        elif isinstance(embedding_data, dict):
-            sparse_indices = embedding_data.get('sparse_indices')
-            sparse_values = embedding_data.get('sparse_values')
-        
-        # Method 3: Check for different attribute names (based on your original output)
-        elif hasattr(embedding_data, 'indices') and hasattr(embedding_data, 'values'):
-            sparse_indices = embedding_data.indices  
-            sparse_values = embedding_data.values
-
-        if sparse_indices is None or sparse_values is None:
-            print(f"❌ Could not extract sparse data. Available attributes: {dir(embedding_data)}")
-            return None
-
-        # Convert to the format expected by Pinecone
-        result = {
-            "indices": [int(idx) for idx in sparse_indices],
-            "values": [float(val) for val in sparse_values]
-        }
-        
-        print(f"✅ Generated sparse embedding: {len(result['indices'])} features")
-        return result
+    # Empty texts are skipped but keep their slot
+    keys = {i: _sparse_cache_key(text, input_type) for i, text in enumerate(texts) if text and text.strip()}
+    cached = _sparse_cache_get_many(list(set(keys.values()))) if use_disk_cache else {}
+    # Uncached key -> every position holding that text, so duplicates are sent once
+    pending = {}
+    for i, key in keys.items():
+        if key in cached:
+            results[i] = cached[key]
+        else:
+            pending.setdefault(key, []).append(i)
+    pending_keys = list(pending)
 
-    except Exception as e:
-        print(f"❌ Error generating sparse embedding: {e}")
+    for start in range(0, len(pending_keys), batch_size):
+        batch_keys = pending_keys[start:start + batch_size]
+        try:
+            response = pc_client.inference.embed(
+                model=SPARSE_MODEL,
+                inputs=[texts[pending[key][0]] for key in batch_keys],
+                parameters={"input_type": input_type, "truncate": "END"}
+            )
+
+            if not response or not hasattr(response, "data") or len(response.data) == 0:
+                logger.error("❌ Sparse embedding failed: No data in response")
+                continue
+
+            embedded = []
+            for key, embedding_data in zip(batch_keys, response.data):
+                sparse = _extract_sparse(embedding_data)
+                if sparse is None:
+                    continue
+                for i in pending[key]:
+                    results[i] = sparse
+                embedded.append((key, sparse))
+            if use_disk_cache:
+                _sparse_cache_put_many(embedded)
+            logger.debug("✅ Generated %d sparse embeddings", len(response.data))
+
+        except Exception as e:
+            logger.error("❌ Error generating sparse embeddings: %s", e)
+
+    return results
+
+def generate_sparse_embedding(text, for_query=False, use_disk_cache=True):
+    """Generate sparse embedding using Pinecone's sparse model."""
+    if not text or not text.strip():
+        logger.warning("⚠️ Skipped sparse embedding: Empty text")
         return None
+    return generate_sparse_embeddings([text], for_query=for_query, use_disk_cache=use_disk_cache)[0]
 
 def upsert_hybrid_vector(index, vector_id, dense_embedding, sparse_embedding, metadata):
     """Upsert dense + sparse embeddings with metadata using Pinecone's hybrid format."""
@@ -89,39 +232,109 @@ def upsert_hybrid_vector(index, vector_id, dense_embedding, sparse_embedding, me
             "metadata": metadata
         }
         
-        # Add sparse values in the correct format
-        if sparse_embedding and isinstance(sparse_embedding, dict):
-            if "indices" in sparse_embedding and "values" in sparse_embedding:
-                # ✅ CORRECTED: Use the exact format from Pinecone documentation
-                vector_data["sparse_values"] = {
-                    'indices': sparse_embedding['indices'], 
-                    'values': sparse_embedding['values']
-                }
-                print(f"🔥 Upserting HYBRID vector: {vector_id}")
-            else:
-                print(f"⚠️ Invalid sparse embedding format, upserting dense-only: {vector_id}")
+        # generate_sparse_embedding already returns Pinecone's sparse_values shape
+        if sparse_embedding:
+            vector_data["sparse_values"] = sparse_embedding
+            logger.debug("🔥 Upserting HYBRID vector: %s", vector_id)
         else:
-            print(f"⚠️ No sparse embedding provided, upserting dense-only: {vector_id}")
+            logger.warning("⚠️ No sparse embedding provided, upserting dense-only: %s", vector_id)
 
         # Upsert the vector using the vectors parameter
         index.upsert(vectors=[vector_data])
-        print(f"✅ Hybrid vector upserted successfully: {vector_id}")
+        logger.debug("✅ Hybrid vector upserted successfully: %s", vector_id)
         
     except Exception as e:
-        print(f"❌ Hybrid Upsert Error for {vector_id}: {e}")
-        print(f"Error details: {str(e)}")
+        logger.error("❌ Hybrid Upsert Error for %s: %s", vector_id, e)
         
         # Try dense-only fallback
         try:
-            print(f"🔄 Attempting dense-only fallback for {vector_id}")
+            logger.info("🔄 Attempting dense-only fallback for %s", vector_id)
             index.upsert(vectors=[{
                 "id": vector_id,
                 "values": dense_embedding,
                 "metadata": metadata
             }])
-            print(f"✅ Dense-only fallback successful: {vector_id}")
+            logger.info("✅ Dense-only fallback successful: %s", vector_id)
         except Exception as fallback_error:
-            print(f"❌ Dense-only fallback also failed: {fallback_error}")
+            logger.error("❌ Dense-only fallback also failed: %s", fallback_error)
+
+def sq8(values, scale=DENSE_SQ8_SCALE):
+    """
+    Quantize a dense vector to int8 levels in [-127, 127] of the global scale.
+    Levels are returned as floats: Pinecone's upsert type check rejects int values.
+    """
+    levels = np.rint(np.asarray(values, dtype=np.float32) * (127.0 / scale))
+    return np.clip(levels, -127, 127).astype(np.float32).tolist()
+
+def sq8_query(values, scale=DENSE_SQ8_SCALE):
+    """Rescale a float query vector so its dot product with sq8 vectors matches the float one."""
+    return (np.asarray(values, dtype=np.float32) * (scale / 127.0)).tolist()
+
+def estimate_record_bytes(record):
+    """Approximate serialized size of one upsert record."""
+    size = len(record["values"]) * FLOAT_JSON_BYTES + len(json.dumps(record.get("metadata") or {}))
+    sparse = record.get("sparse_values")
+    if sparse:
+        size += len(sparse["indices"]) * INDEX_JSON_BYTES + len(sparse["values"]) * FLOAT_JSON_BYTES
+    return size + len(record["id"])
+
+def size_chunks(records, max_vectors=100, max_bytes=UPSERT_MAX_BYTES):
+    """
+    Yield batches capped at max_vectors records or about max_bytes of payload,
+    whichever comes first. A record too large on its own loses its metadata.
+    """
+    batch, batch_bytes = [], 0
+    for record in records:
+        record_bytes = estimate_record_bytes(record)
+        if record_bytes > max_bytes and record.get("metadata"):
+            logger.warning("⚠️ Record %s exceeds upsert size limit, dropping metadata", record["id"])
+            record = {**record, "metadata": {}}
+            record_bytes = estimate_record_bytes(record)
+        if batch and (len(batch) >= max_vectors or batch_bytes + record_bytes > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(record)
+        batch_bytes += record_bytes
+    if batch:
+        yield batch
+
+def upsert_hybrid_vectors_batch(index, vectors_list, batch_size=100, quantize=DENSE_SQ8):
+    """
+    Upsert many (vector_id, dense_embedding, sparse_embedding, metadata) tuples.
+    Batches (at most batch_size vectors and UPSERT_MAX_BYTES each) are sent with
+    async_req=True so they run in parallel on the index's thread pool (see
+    init_pinecone's pool_threads). With quantize, dense values are sent as sq8 levels.
+    Returns the number of vectors upserted.
+    """
+    records = []
+    for vector_id, dense_embedding, sparse_embedding, metadata in vectors_list:
+        record = {
+            "id": vector_id,
+            "values": sq8(dense_embedding) if quantize else dense_embedding,
+            "metadata": metadata
+        }
+        if sparse_embedding:
+            record["sparse_values"] = sparse_embedding
+        records.append(record)
+
+    pending = []
+    for batch in size_chunks(records, max_vectors=batch_size):
+        try:
+            pending.append((len(batch), index.upsert(vectors=batch, async_req=True)))
+        except Exception as e:
+            logger.error("❌ Batch Upsert Error: %s", e)
+
+    # Wait for every batch; .get() re-raises that batch's upsert error
+    upserted = 0
+    for batch_len, async_result in pending:
+        try:
+            async_result.get()
+            upserted += batch_len
+        except Exception as e:
+            logger.error("❌ Batch Upsert Error: %s", e)
+
+    logger.info("✅ Upserted %d/%d hybrid vectors in %d batch(es)", upserted, len(records), len(pending))
+    return upserted
 
 def debug_sparse_embedding(text):
     """Debug function to inspect sparse embedding structure."""
@@ -2,6 +2,12 @@
 import sqlite3
 import os
 
+INSERT_METADATA_SQL = """
+    INSERT OR REPLACE INTO patent_chunks (
+        vector_id, patent_number, title, description, abstract, claims_text, detailed_summary
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
 def init_sqlite():
     """
     Initialize SQLite database and create the table if it doesn't exist.
@@ -12,6 +18,12 @@ def init_sqlite():
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
+    # WAL + NORMAL sync: commits no longer fsync the main DB file each time
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS patent_chunks (
             vector_id TEXT PRIMARY KEY,
@@ -32,11 +44,7 @@ def insert_metadata(cursor, vector_id, patent_number, title, description, abstra
     """
     Insert metadata for a single chunk into the SQLite DB.
     """
-    cursor.execute("""
-        INSERT OR REPLACE INTO patent_chunks (
-            vector_id, patent_number, title, description, abstract, claims_text, detailed_summary
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (
+    cursor.execute(INSERT_METADATA_SQL, (
         vector_id,
         patent_number,
         title,
@@ -46,6 +54,15 @@ def insert_metadata(cursor, vector_id, patent_number, title, description, abstra
         detailed_summary
     ))
 
+def insert_metadata_many(cursor, rows):
+    """
+    Insert metadata for many chunks in one executemany call and one transaction
+    (committed on success, rolled back on error).
+    Each row is (vector_id, patent_number, title, description, abstract, claims_text, detailed_summary).
+    """
+    with cursor.connection:
+        cursor.executemany(INSERT_METADATA_SQL, rows)
+
 def close_sqlite(conn):
     """
     Commit changes and close the SQLite connection.
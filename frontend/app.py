@@ -1,11 +1,118 @@
 import os
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 from datetime import datetime
 import time
 
 # Configuration
 API_URL = os.getenv("API_URL", "http://127.0.0.1:8000/search")
+# Base server (root endpoint) used for the status check
+API_BASE_URL = API_URL.replace("/search", "")
+# Most recent Q/A pairs sent to the API as follow-up context
+MAX_API_HISTORY = int(os.getenv("MAX_API_HISTORY", "20"))
+# Stylesheet shipped next to the app
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
+
+@st.cache_resource
+def get_http_session():
+    """Shared HTTP session so reruns and queries reuse pooled keep-alive connections."""
+    session = requests.Session()
+    # Retry applies to idempotent requests only (the status check), not search POSTs
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=2, backoff_factor=0.3)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=15, show_spinner=False)
+def check_api_status(base_url):
+    """
+    Ping the API at most once per 15 s instead of on every rerun.
+    Returns (status_code, None) or (None, "unreachable" | "timeout" | error text).
+    """
+    try:
+        return get_http_session().get(base_url, timeout=3).status_code, None
+    except requests.exceptions.ConnectionError:
+        return None, "unreachable"
+    except requests.exceptions.Timeout:
+        return None, "timeout"
+    except Exception as e:
+        return None, str(e)
+
+class SearchApiError(Exception):
+    """Non-200 response from the search API (raised so it is never cached)."""
+    def __init__(self, status_code, text):
+        super().__init__(f"Status {status_code}")
+        self.status_code = status_code
+        self.text = text
+
+def post_search(payload_json):
+    """POST a serialized (bytes) search payload; returns the JSON body or raises SearchApiError."""
+    response = get_http_session().post(
+        API_URL,
+        data=payload_json,
+        headers={"Content-Type": "application/json"},
+        timeout=30
+    )
+    if response.status_code != 200:
+        raise SearchApiError(response.status_code, response.text)
+    return orjson.loads(response.content)
+
+# Successful responses cached per serialized payload (query, history, hybrid, summary);
+# errors and timeouts raise, so they are never cached. Only summary-off searches use it:
+# summary searches (the default) are streamed by open_search_stream, and repeats of
+# those are served from the backend's llm_cache instead.
+cached_search = st.cache_data(ttl=3600, max_entries=256, show_spinner=False)(post_search)
+
+def open_search_stream(payload):
+    """
+    POST a search with stream=True. Returns (data, summary_deltas): the response
+    without its summary, and an iterator of summary text pieces (None when the
+    summary isn't streamed). A server without streaming answers with plain JSON.
+    """
+    response = get_http_session().post(
+        API_URL,
+        data=orjson.dumps({**payload, "stream": True}),
+        headers={"Content-Type": "application/json"},
+        stream=True,
+        timeout=30
+    )
+    if response.status_code != 200:
+        raise SearchApiError(response.status_code, response.text)
+    if "ndjson" not in response.headers.get("Content-Type", ""):
+        return orjson.loads(response.content), None
+
+    lines = response.iter_lines()
+    data = orjson.loads(next(lines))
+    if not data.get("live_summary_stream"):
+        response.close()
+        return data, None
+
+    def summary_deltas():
+        with response:
+            for line in lines:
+                if line:
+                    yield orjson.loads(line).get("live_summary_delta", "")
+
+    return data, summary_deltas()
+
+def format_results(data):
+    """Markdown parts listing data["results"], or a no-results notice."""
+    if not data.get("results"):
+        return ["🤔 **No Results Found:** No relevant patents were found for your query. Try rephrasing or using different keywords."]
+    parts = ["🔍 **Patent Search Results:**\n"]
+    for idx, doc in enumerate(data["results"], 1):
+        result_text = f"**#{idx} {doc.get('title', 'Untitled Patent')}**\n"
+        result_text += f"*Patent Number: {doc.get('patent_number', 'N/A')}*\n\n"
+        result_text += f"{doc.get('detailed_summary', 'No summary available.')}\n"
+        parts.append(result_text)
+    return parts
 
 # Page configuration with custom styling
 st.set_page_config(
@@ -15,169 +122,14 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for professional styling
-st.markdown("""
-<style>
-    /* Main container styling */
-    .main {
-        padding-top: 2rem;
-    }
-    
-    /* Header styling */
-    .header-container {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 2rem;
-        border-radius: 15px;
-        margin-bottom: 2rem;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-    }
-    
-    .header-title {
-        color: white;
-        font-size: 2.5rem;
-        font-weight: 700;
-        text-align: center;
-        margin: 0;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-    }
-    
-    .header-subtitle {
-        color: rgba(255,255,255,0.9);
-        font-size: 1.1rem;
-        text-align: center;
-        margin-top: 0.5rem;
-        font-weight: 300;
-    }
-    
-    /* Chat message styling */
-    .user-message {
-        background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%);
-        padding: 1.2rem 1.8rem;
-        border-radius: 18px 18px 4px 18px;
-        margin: 1rem 0;
-        color: white;
-        box-shadow: 0 3px 12px rgba(99, 102, 241, 0.25);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    
-    .assistant-message {
-        background: linear-gradient(135deg, #f8fafc 0%, #e2e8f0 100%);
-        padding: 1.2rem 1.8rem;
-        border-radius: 18px 18px 18px 4px;
-        margin: 1rem 0;
-        color: #1e293b;
-        box-shadow: 0 3px 12px rgba(0, 0, 0, 0.08);
-        border: 1px solid #e2e8f0;
-    }
-    
-    /* Sidebar styling */
-    .sidebar .sidebar-content {
-        background: linear-gradient(180deg, #f8f9fa 0%, #e9ecef 100%);
-    }
-    
-    /* Status indicators */
-    .status-success {
-        background-color: #f0f9ff;
-        border: 1px solid #0ea5e9;
-        color: #0c4a6e;
-        padding: 0.875rem 1.25rem;
-        border-radius: 10px;
-        margin: 0.75rem 0;
-        border-left: 4px solid #0ea5e9;
-    }
-    
-    .status-info {
-        background-color: #fefce8;
-        border: 1px solid #eab308;
-        color: #713f12;
-        padding: 0.875rem 1.25rem;
-        border-radius: 10px;
-        margin: 0.75rem 0;
-        border-left: 4px solid #eab308;
-    }
-    
-    .status-warning {
-        background-color: #fef2f2;
-        border: 1px solid #ef4444;
-        color: #7f1d1d;
-        padding: 0.875rem 1.25rem;
-        border-radius: 10px;
-        margin: 0.75rem 0;
-        border-left: 4px solid #ef4444;
-    }
-    
-    /* Patent result cards */
-    .patent-card {
-        background: white;
-        border: 1px solid #e1e8ed;
-        border-radius: 12px;
-        padding: 1.5rem;
-        margin: 1rem 0;
-        box-shadow: 0 2px 10px rgba(0,0,0,0.08);
-        transition: transform 0.2s ease, box-shadow 0.2s ease;
-    }
-    
-    .patent-card:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 8px 25px rgba(0,0,0,0.15);
-    }
-    
-    .patent-title {
-        color: #2c3e50;
-        font-size: 1.2rem;
-        font-weight: 600;
-        margin-bottom: 0.5rem;
-    }
-    
-    .patent-number {
-        color: #7f8c8d;
-        font-size: 0.9rem;
-        font-weight: 500;
-        margin-bottom: 1rem;
-    }
-    
-    /* Loading animation */
-    .loading-container {
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        padding: 2rem;
-    }
-    
-    .loading-text {
-        margin-left: 1rem;
-        color: #667eea;
-        font-weight: 500;
-    }
-    
-    /* Statistics container */
-    .stats-container {
-        display: flex;
-        justify-content: space-around;
-        background: white;
-        border-radius: 10px;
-        padding: 1rem;
-        margin: 1rem 0;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-    }
-    
-    .stat-item {
-        text-align: center;
-    }
-    
-    .stat-number {
-        font-size: 1.5rem;
-        font-weight: bold;
-        color: #667eea;
-    }
-    
-    .stat-label {
-        font-size: 0.8rem;
-        color: #7f8c8d;
-        text-transform: uppercase;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Custom CSS for professional styling. Streamlit clears the page on every rerun,
+# so the <style> tag is re-sent each time, but the file is read only once per process.
+@st.cache_resource
+def load_css():
+    with open(CSS_PATH, encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # Initialize session state
 if "history" not in st.session_state:
@@ -186,6 +138,8 @@ if "query_count" not in st.session_state:
     st.session_state.query_count = 0
 if "session_start" not in st.session_state:
     st.session_state.session_start = datetime.now()
+if "api_history" not in st.session_state:
+    st.session_state.api_history = []
 
 # Header section
 st.markdown("""
@@ -212,6 +166,12 @@ with st.sidebar:
         help="Creates a comprehensive summary of search results"
     )
     
+    force_refresh = st.checkbox(
+        "♻️ Bypass Response Cache",
+        value=False,
+        help="Always query the API, even for a question already answered this hour"
+    )
+    
     st.markdown("---")
     
     # Session statistics
@@ -221,7 +181,9 @@ with st.sidebar:
     
     col1, col2 = st.columns(2)
     with col1:
-        st.metric("Queries", st.session_state.query_count)
+        # Placeholder so a new query can update the count without a rerun
+        queries_metric = st.empty()
+        queries_metric.metric("Queries", st.session_state.query_count)
     with col2:
         st.metric("Duration", f"{duration_minutes}m")
     
@@ -230,44 +192,56 @@ with st.sidebar:
     # Clear chat button
     if st.button("🗑️ Clear Chat History", type="secondary", use_container_width=True):
         st.session_state.history = []
+        st.session_state.api_history = []
         st.session_state.query_count = 0
         st.session_state.session_start = datetime.now()
         st.rerun()
     
-    # API status
     # API status
     st.markdown("### 🔗 API Status")
-    try:
-        # Try to connect to the base server (root endpoint)
-        base_url = API_URL.replace("/search", "")
-        test_response = requests.get(base_url, timeout=3)
-        
-        if test_response.status_code == 200:
-            st.success("✅ API Connected")
-        elif test_response.status_code in [404, 405]:
-            # Server is running but endpoint doesn't exist - that's fine
-            st.success("✅ API Connected")
-        else:
-            st.warning(f"⚠️ API Responding (Status: {test_response.status_code})")
-            
-    except requests.exceptions.ConnectionError:
+    status_code, status_error = check_api_status(API_BASE_URL)
+    if status_code == 200:
+        st.success("✅ API Connected")
+    elif status_code in [404, 405]:
+        # Server is running but endpoint doesn't exist - that's fine
+        st.success("✅ API Connected")
+    elif status_code is not None:
+        st.warning(f"⚠️ API Responding (Status: {status_code})")
+    elif status_error == "unreachable":
         st.error("❌ API Unreachable")
-    except requests.exceptions.Timeout:
+    elif status_error == "timeout":
         st.warning("⚠️ API Timeout")
-    except Exception as e:
-        st.error(f"❌ API Error: {str(e)}")
+    else:
+        st.error(f"❌ API Error: {status_error}")
 
 # Main chat interface
 chat_container = st.container()
 
-# Display chat history with Streamlit's native chat components
+def render_turn(turn):
+    """Render one chat turn with Streamlit's native chat components."""
+    with st.chat_message(turn["role"]):
+        if turn["role"] == "user":
+            st.markdown(f"**You:** {turn['content']}")
+        else:
+            st.markdown(turn["content"])
+
+def add_assistant_turn(question, content):
+    """Record an assistant reply in the chat history and as a Q/A pair for the API."""
+    st.session_state.history.append({"role": "assistant", "content": content})
+    st.session_state.api_history.append({"question": question, "answer": content})
+    del st.session_state.api_history[:-MAX_API_HISTORY]
+
+def render_history(history):
+    """
+    Past turns. New turns are rendered in place below this (no st.rerun), so
+    each message costs one script run instead of two.
+    """
+    for turn in history:
+        render_turn(turn)
+
+# Display chat history
 with chat_container:
-    for i, turn in enumerate(st.session_state.history):
-        with st.chat_message(turn["role"]):
-            if turn["role"] == "user":
-                st.markdown(f"**You:** {turn['content']}")
-            else:
-                st.markdown(turn["content"])
+    render_history(st.session_state.history)
 
 # Chat input
 query = st.chat_input("💬 Enter your patent-related question here...")
@@ -277,16 +251,14 @@ if query:
     # Add user message to history
     st.session_state.history.append({"role": "user", "content": query})
     st.session_state.query_count += 1
+    queries_metric.metric("Queries", st.session_state.query_count)
+    
+    # Show the new message right away instead of rerunning the whole script
+    with chat_container:
+        render_turn(st.session_state.history[-1])
 
-    # Prepare API history (Q/A pairs)
-    api_history = []
-    last_user_q = None
-    for turn in st.session_state.history[:-1]:  # Exclude the current query
-        if turn["role"] == "user":
-            last_user_q = turn["content"]
-        elif turn["role"] == "assistant" and last_user_q:
-            api_history.append({"question": last_user_q, "answer": turn["content"]})
-            last_user_q = None
+    # API history (Q/A pairs), maintained incrementally by add_assistant_turn
+    api_history = list(st.session_state.api_history)
 
     # Show loading spinner with custom styling
     with st.spinner("🔍 Analyzing patents and generating response..."):
@@ -299,80 +271,87 @@ if query:
                 "summary": summary
             }
             
-            # Make API request
-            response = requests.post(API_URL, json=payload, timeout=30)
-
-            if response.status_code == 200:
-                data = response.json()
-                reply_parts = []
-
-                # Process response data
-                # Related/unrelated indicator (only for follow-up queries)
-                if len(api_history) > 0 and "related" in data:
-                    if data["related"]:
-                        reply_parts.append("🔗 **Follow-up Query Detected:** This question is related to your previous query and will build upon the context.")
-                    else:
-                        reply_parts.append("ℹ️ **New Topic Detected:** This appears to be a new question unrelated to previous queries.")
-
-                # Add notes if present
-                if "note" in data and data["note"]:
-                    reply_parts.append(f"📋 **Note:** {data['note']}")
-
-                # Handle different response types
-                if "message" in data and "not relevant" in data["message"].lower():
-                    reply_parts.append(f"🚫 **Query Not Relevant:** {data['message']}")
-                elif "generic_answer" in data:
-                    if "message" in data:
-                        reply_parts.append(f"📋 **System Message:** {data['message']}")
-                    reply_parts.append(f"🤖 **Response:** {data['generic_answer']}")
-                elif summary and "live_summary" in data and data["live_summary"]:
-                    reply_parts.append(f"📄 **Comprehensive Summary:**\n\n{data['live_summary']}")
-                elif "results" in data and data["results"]:
-                    reply_parts.append("🔍 **Patent Search Results:**\n")
-                    for idx, doc in enumerate(data["results"], 1):
-                        result_text = f"**#{idx} {doc.get('title', 'Untitled Patent')}**\n"
-                        result_text += f"*Patent Number: {doc.get('patent_number', 'N/A')}*\n\n"
-                        result_text += f"{doc.get('detailed_summary', 'No summary available.')}\n"
-                        reply_parts.append(result_text)
+            # Make API request. Summaries are streamed as Gemini writes them (so they
+            # skip the response cache); other searches go through cached_search.
+            summary_deltas = None
+            if summary:
+                data, summary_deltas = open_search_stream(payload)
+            else:
+                # sort_keys gives a stable cache key
+                payload_json = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+                data = post_search(payload_json) if force_refresh else cached_search(payload_json)
+            reply_parts = []
+
+            # Process response data
+            # Related/unrelated indicator (only for follow-up queries)
+            if len(api_history) > 0 and "related" in data:
+                if data["related"]:
+                    reply_parts.append("🔗 **Follow-up Query Detected:** This question is related to your previous query and will build upon the context.")
                 else:
-                    reply_parts.append("🤔 **No Results Found:** No relevant patents were found for your query. Try rephrasing or using different keywords.")
+                    reply_parts.append("ℹ️ **New Topic Detected:** This appears to be a new question unrelated to previous queries.")
 
-                # Combine response parts
-                reply_text = "\n\n".join([p for p in reply_parts if p.strip()])
-                
-                # Display the response with proper formatting
-                with st.chat_message("assistant"):
-                    st.markdown(reply_text)
-                
-                # Add to history
-                st.session_state.history.append({"role": "assistant", "content": reply_text})
+            # Add notes if present
+            if "note" in data and data["note"]:
+                reply_parts.append(f"📋 **Note:** {data['note']}")
 
+            # Handle different response types
+            if "message" in data and "not relevant" in data["message"].lower():
+                reply_parts.append(f"🚫 **Query Not Relevant:** {data['message']}")
+            elif "generic_answer" in data:
+                if "message" in data:
+                    reply_parts.append(f"📋 **System Message:** {data['message']}")
+                reply_parts.append(f"🤖 **Response:** {data['generic_answer']}")
+            elif summary_deltas is not None:
+                pass  # Streamed into the chat message below
+            elif summary and "live_summary" in data and data["live_summary"]:
+                reply_parts.append(f"📄 **Comprehensive Summary:**\n\n{data['live_summary']}")
             else:
-                error_msg = f"⚠️ **API Error**\n\nStatus Code: {response.status_code}\n\nDetails: {response.text}"
-                with st.chat_message("assistant"):
-                    st.error(error_msg)
-                st.session_state.history.append({"role": "assistant", "content": error_msg})
+                reply_parts.extend(format_results(data))
+
+            # Combine response parts
+            reply_text = "\n\n".join([p for p in reply_parts if p.strip()])
+            
+            # Display the response with proper formatting
+            with st.chat_message("assistant"):
+                if reply_text:
+                    st.markdown(reply_text)
+                if summary_deltas is not None:
+                    st.markdown("📄 **Comprehensive Summary:**")
+                    summary_text = st.write_stream(summary_deltas)
+                    if summary_text:
+                        summary_part = f"📄 **Comprehensive Summary:**\n\n{summary_text}"
+                    else:
+                        # No summary came through; fall back to the plain results
+                        summary_part = "\n\n".join(["⚠️ Summary unavailable."] + format_results(data))
+                        st.markdown(summary_part)
+                    reply_text = "\n\n".join(p for p in (reply_text, summary_part) if p)
+            
+            # Add to history
+            add_assistant_turn(query, reply_text)
+
+        except SearchApiError as e:
+            error_msg = f"⚠️ **API Error**\n\nStatus Code: {e.status_code}\n\nDetails: {e.text}"
+            with st.chat_message("assistant"):
+                st.error(error_msg)
+            add_assistant_turn(query, error_msg)
 
         except requests.exceptions.Timeout:
             timeout_msg = "⏱️ **Request Timeout:** The search is taking longer than expected. Please try again or simplify your query."
             with st.chat_message("assistant"):
                 st.warning(timeout_msg)
-            st.session_state.history.append({"role": "assistant", "content": timeout_msg})
+            add_assistant_turn(query, timeout_msg)
             
         except requests.exceptions.ConnectionError:
             connection_msg = "🔌 **Connection Error:** Unable to connect to the patent search API. Please check your connection and try again."
             with st.chat_message("assistant"):
                 st.error(connection_msg)
-            st.session_state.history.append({"role": "assistant", "content": connection_msg})
+            add_assistant_turn(query, connection_msg)
             
         except Exception as e:
             error_msg = f"❌ **Unexpected Error:** An unexpected error occurred: {str(e)}\n\nPlease try again or contact support if the issue persists."
             with st.chat_message("assistant"):
                 st.error(error_msg)
-            st.session_state.history.append({"role": "assistant", "content": error_msg})
-
-    # Auto-scroll to bottom (trigger rerun to show new messages)
-    st.rerun()
+            add_assistant_turn(query, error_msg)
 
 # Footer
 st.markdown("---")